@@ -1,60 +1,77 @@
+import time
+
+# for measuring how long startup takes, including imports
+_import_start_ms = time.ticks_ms()
+
 from app import App
 from app_components import clear_background, Menu
 from system.eventbus import eventbus
-from tildagonos import tildagonos
 from events.input import BUTTON_TYPES, ButtonDownEvent
 from system.patterndisplay.events import PatternDisable, PatternEnable
 from system.scheduler.events import RequestForegroundPushEvent
-import asyncio
+import gc
 import math
-import random
 import sys
-import time
 
-from .steps.base import BlockStep, Step, EndStep, WhenStep
-from .steps.button import WhenButtonPushedStep, InsertWhenButtonPushedUI
-from .steps.count import CountLoopsStep, InsertCountLoopsUI
-from .steps.forever import RepeatForeverStep, InsertRepeatForeverStepUI
-from .steps.imu import WhenIMUUpright, InsertIMUUpright
-from .steps.led import LEDStep, InsertLEDStepUI
-from .steps.pause import PauseStep, InsertPauseStepUI
-from .steps.whenplay import WhenPlayStep, InsertWhenPlayStepUI
-
-from .const import LIVE_SIZE, PLAY_MODE, EDIT_MODE, MENU_MODE, INSERT_STEP_MODE
+# Step modules other than base are loaded on demand through the registry.
+from .steps.base import BlockStep, Step, EndStep, WhenStep, QUOTA_WINDOW_MS
+from . import registry
+from . import variables
+
+from . import calls
+from . import clock
+from . import collector
+from . import leds
+from . import timers
+from .checkpoint import load_checkpoint, make_checkpoint, restore_checkpoint, save_checkpoint
+from .files import ensure_save_dir
+from .history import EditHistory
+from . import library
+from . import params
+from .pickers.menu import open_menu
+from .pickers.problems import ProblemsUI
+from .program import DEFAULT_PROGRAM, link_steps, program_from_data, resolve_calls
+from .trace import TraceRecorder, TracePlayer, TRACE_FILE, load_trace
+from .verify import Problem, check_data, check_structure, verify
+
+from .const import LIVE_SIZE, PLAY_MODE, EDIT_MODE, MENU_MODE, INSERT_STEP_MODE, REPLAY_MODE, TEMPO_MODE, LIBRARY_MODE, PROBLEMS_MODE
 
 import platform
 if hasattr(platform, "python_implementation") and platform.python_implementation() == 'CPython':
     from typing import Any, Optional
 
-from .pickers.colour import ColourPicker
-
 OTHER_SIZE = 20
 
 STEP_PERIOD_MS = 100
 
+# When playing fast, steps are run on every update rather than every
+# STEP_PERIOD_MS, and up to this many steps that finish straight away
+# are run in one update.
+FAST_STEPS_PER_UPDATE = 50
+
+MAIN_MENU_ITEMS = ["Insert step", "Delete step", "Undo", "Redo", "Play", "Play fast", "Play in background", "Play and record", "Replay recording", "Set tempo", "Save program", "Load program"]
+
+# tempos offered by the Set tempo menu
+TEMPO_CHOICES = [60, 90, 100, 110, 120, 128, 140, 160]
+TEMPO_LABELS = [f"{bpm} BPM" for bpm in TEMPO_CHOICES]
+
+# how often to save a checkpoint while playing
+CHECKPOINT_PERIOD_MS = 30000
+
+# Saving a checkpoint allocates and writes to flash, which takes a while,
+# so while playing it only happens when nothing needs to happen for at
+# least this long. A program that is never idle for that long isn't
+# checkpointed.
+CHECKPOINT_IDLE_MS = 100
+
 class ScripterApp(App):
+  # Whether to load and save checkpoints on the badge filesystem. Host
+  # tools that run programs turn this off.
+  checkpoints_enabled = True
+
   def __init__(self):
    try:
-    self.sequence = [WhenButtonPushedStep(self),
-                       LEDStep(255,255,255),
-                       PauseStep(500),
-                       LEDStep(0,0,255),
-                       PauseStep(500),
-                     EndStep(),
-
-                     WhenPlayStep(),
-                       RepeatForeverStep(),
-                         LEDStep(255,0,0),
-                         PauseStep(500),
-                         LEDStep(0,0,0),
-                         PauseStep(500),
-                       EndStep(),
-                     EndStep(),
-
-                     WhenIMUUpright(),
-                       LEDStep(0,255,0),
-                     EndStep(),
-                     ]
+    self.sequence: list[Step] = []
 
     # sequence_pos can be positive or negative.
     # when it is negative, it represents something about the code being
@@ -64,65 +81,237 @@ class ScripterApp(App):
     # representable)
     self.sequence_pos = 0
 
+    # undo/redo log of edits made to self.sequence. Edits should go
+    # through insert_steps/delete_steps so that they are recorded.
+    self.history = EditHistory()
+
     self._mode = EDIT_MODE
-    self._reset_steps()
 
     # so that two different polling loops can run
     # a poll for step
     self._last_step_time_ms = 0
 
+    # how often to step, and how many steps can run in one go: see
+    # FAST_STEPS_PER_UPDATE
+    self._step_period_ms = STEP_PERIOD_MS
+    self._steps_per_update = 1
+    # True if the last play step found the program waiting (for a pause,
+    # an animation, a trigger or its quota) rather than with steps ready
+    # to run. See _idle_ms.
+    self._waiting = False
+
+    # the When steps of the program, which have CPU quotas, and when
+    # the current quota window started.
+    self._when_steps: list[WhenStep] = []
+    self._quota_window_ms = 0
+
+    # when a checkpoint was last saved during play
+    self._last_checkpoint_ms = 0
+
+    # file being recorded to, while play is being recorded
+    self._trace_file: Optional[Any] = None
+
+    # player for REPLAY_MODE
+    self._trace_player: Optional[TracePlayer] = None
+
+    # name of the current program in the program library, if it came
+    # from there or has been saved there.
+    self.program_name: Optional[str] = None
+
+    # program library index entries, while choosing a program to load
+    self._library_entries: list = []
+
+    # verify.Problems stopping the program from playing (or something
+    # else from being done), and the heading to show them under, in
+    # PROBLEMS_MODE. See _show_problems.
+    self._problems: list = []
+    self._problems_heading = ""
+
     # TODO: not an Any, it's a "ui delegate", however that
     # should be typed (what calls am I making on it? it's like
     # Menu, for example, or my various similar classes)
     self.ui_delegate: Optional[Any] = None
 
+    # UI delegates that are kept for reuse, by name, rather than being
+    # rebuilt each time they are opened. See pickers.menu.open_menu.
+    self.ui_pool: dict = {}
+
+    # Carry on from where we were before an app switch or reboot if
+    # possible, otherwise start with the default program.
+    if not self._resume_from_checkpoint():
+      self.sequence = program_from_data(self, DEFAULT_PROGRAM)
+      self._reset_steps()
+
     self._maximised()
     eventbus.on(RequestForegroundPushEvent, self._handle_foreground_push, self)
+
+    print(f"Scripter startup took {time.ticks_diff(time.ticks_ms(), _import_start_ms)}ms")
    except Exception as e:
 
     # ignore type error here: cpython doesn't have print_exception, but sim and badge do.
     sys.print_exception(e) # type: ignore
 
   def _reset_steps(self):
-    end_stack: list[BlockStep] = []
-    n = 0
+    variables.reset()
+    leds.animation = None
+    # timer steps schedule themselves again when they are reset
+    timers.clear()
+
+    calls.reset()
+
+    link_steps(self.sequence)
+    self._when_steps = [step for step in self.sequence if isinstance(step, WhenStep)]
+    # point calls at their routines, so that nothing is looked up by
+    # routine number while playing.
+    resolve_calls(self.sequence)
+    # let go of shared parameters that only edited-out steps used
+    params.prune(self.sequence)
+
+    # Let blocks precompute things about their bodies, such as loops that
+    # can be played without the interpreter, or that would never pause.
+    # The program can't change while playing, so doing this here is
+    # enough.
     for step in self.sequence:
-      step.reset()
-
-      step._step_number = n
-
-      if isinstance(step, WhenStep):
-        assert end_stack == [], f"When-steps can only occur at the top level: {end_stack}"
-      else:
-        assert end_stack != [], f"Top level steps but be When-steps: {end_stack}"
- 
       if isinstance(step, BlockStep):
-        print(f"Appending to block stack for step {n}, {step}")
-        print(f"Stack: {end_stack}")
-        end_stack.append(step)
+        step.analyse_body(self.sequence)
+
+  def insert_steps(self, pos, steps):
+    """Insert a list of steps at pos, recording the edit for undo."""
+    self.sequence[pos:pos] = steps
+    self.history.record_insert(pos, steps)
+    self._relink()
+
+  def delete_steps(self, start, end):
+    """Delete steps start..end inclusive, recording the edit for undo."""
+    removed = self.sequence[start:end+1]
+    del self.sequence[start:end+1]
+    self.history.record_delete(start, removed)
+    self._relink()
+
+  def _relink(self):
+    # Link the program after an edit, if it is well formed enough to be,
+    # so that step numbers, block links and what blocks work out about
+    # their bodies (such as busy loop warnings) match the program.
+    if len(check_structure(self.sequence)) == 0:
+      self._reset_steps()
 
-      if isinstance(step, EndStep):
-        print(f"Popping from block stack for step {n}, {step}")
-        step._start_step = end_stack.pop()
-        step._start_step._end_step = n
-        print(f"Stack: {end_stack}")
+  def _apply_history(self, pos):
+    # pos is where the undo/redo happened, or None if nothing happened.
+    if pos is not None:
+      if pos >= len(self.sequence):
+        pos = len(self.sequence) - 1
+      self.sequence_pos = pos
+      assert self.sequence_pos >= 0
+      assert self.sequence_pos < len(self.sequence)
+      # postcondition: undo/redo restores a well-formed program
+      self._reset_steps()
 
-      n += 1
+  def _resume_from_checkpoint(self):
+    if not self.checkpoints_enabled:
+      return False
+    checkpoint = load_checkpoint()
+    if checkpoint is None:
+      return False
+    try:
+      playing = restore_checkpoint(self, checkpoint, time.ticks_ms())
+    except Exception as e:
+      print("Could not restore checkpoint - ignoring it")
+      sys.print_exception(e) # type: ignore
+      return False
+    if playing and self._verify():
+      self._mode = PLAY_MODE
+      collector.start_play()
+    else:
+      self.sequence_pos = abs(self.sequence_pos)
+    return True
+
+  def _save_checkpoint(self):
+    if not self.checkpoints_enabled:
+      return
+    now = time.ticks_ms()
+    self._last_checkpoint_ms = now
+    try:
+      save_checkpoint(make_checkpoint(self, now))
+    except Exception as e:
+      # not being able to checkpoint shouldn't stop the program running,
+      # or crash the UI, whatever went wrong.
+      print("Could not save checkpoint")
+      sys.print_exception(e) # type: ignore
+
+  def _verify(self):
+    # Check the program can be played. If not, show why and return False.
+    problems = verify(self.sequence)
+    if len(problems) > 0:
+      self._show_problems(problems)
+      return False
+    return True
+
+  def _show_problems(self, problems, heading="Can't play:"):
+    # Show a list of verify.Problems, until a button is pressed.
+    print(heading)
+    for p in problems:
+      print(f"  {p}")
+    self._problems = problems
+    self._problems_heading = heading
+    self._mode = PROBLEMS_MODE
+    self.ui_delegate = None
 
-    # TODO: the UI needs to enforce this too, because otherwise users will
-    # easily violate this.
-    assert end_stack == [], f"end stack is not empty after step reset: {end_stack}"
+  def _start_play(self, fast=False):
+    """Start playing, if the program can be played. Returns whether it
+    started."""
+    # link the program and start every step afresh. verify reports
+    # anything that stops it being linked.
+    self._relink()
+    if not self._verify():
+      return False
+    self.sequence_pos = -1
+    self._mode = PLAY_MODE
+    if fast:
+      self._step_period_ms = 0
+      self._steps_per_update = FAST_STEPS_PER_UPDATE
+    else:
+      self._step_period_ms = STEP_PERIOD_MS
+      self._steps_per_update = 1
+    self._last_checkpoint_ms = time.ticks_ms()
+    self._quota_window_ms = self._last_checkpoint_ms
+    clock.start_play(self._last_checkpoint_ms)
+    collector.start_play()
+    return True
+
+  def _start_recording(self):
+    ensure_save_dir()
+    self._trace_file = open(TRACE_FILE, "wb")
+    leds.recorder = TraceRecorder(time.ticks_ms(), stream=self._trace_file)
+
+  def _stop_recording(self):
+    if leds.recorder is not None:
+      leds.recorder.finish(time.ticks_ms())
+      leds.recorder = None
+    if self._trace_file is not None:
+      self._trace_file.close()
+      self._trace_file = None
+
+  def _start_replay(self):
+    data = load_trace()
+    if data is None:
+      self._show_problems([Problem(None, "No recording: use Play and record")], "Can't replay:")
+      return
+    self._trace_player = TracePlayer(data, time.ticks_ms())
+    self._mode = REPLAY_MODE
 
   def _handle_foreground_push(self, event):
     if event.app == self:
       print("Foreground push for scripter app - restoring foreground state")
       self._maximised()
     else:
-      print("Foreground push for other app - ignoring")
+      print("Foreground push for other app")
+      # it needs automatic garbage collection back
+      collector.set_foreground(False)
       # TODO: we could actually trigger a when block on this?
       # "do something when a different app/some specific other app comes to foreground"
 
   def _maximised(self):
+    collector.set_foreground(True)
     eventbus.on(ButtonDownEvent, self._handle_buttondown, self)
     print("Scripter is disabling pattern in update")
     eventbus.emit(PatternDisable())
@@ -135,87 +324,195 @@ class ScripterApp(App):
     elif self._mode == MENU_MODE:
       # print("main menu update")
       if self.ui_delegate is None:
-          self.ui_delegate = Menu(self, ["Insert step", "Delete step", "Play", "Play in background"], select_handler=self._handle_menu_select, back_handler=self._handle_menu_back)
+          self.ui_delegate = open_menu(self, "main", self._main_menu_items(), self._handle_menu_select, self._handle_menu_back)
           # TODO: Edit step
           # TODO: Play in background
           # TODO: Choose difficulty
       return self.ui_delegate.update(delta)
     elif self._mode == INSERT_STEP_MODE:
       if self.ui_delegate is None:
-        self.ui_delegate = InsertStepUI(self)
+        insert_ui = self.ui_pool.get("insert")
+        if insert_ui is None:
+          insert_ui = InsertStepUI(self)
+          self.ui_pool["insert"] = insert_ui
+        else:
+          insert_ui.open()
+        self.ui_delegate = insert_ui
+      return self.ui_delegate.update(delta)
+    elif self._mode == LIBRARY_MODE:
+      if self.ui_delegate is None:
+        self._library_entries = library.load_index()["programs"]
+        if len(self._library_entries) == 0:
+          # (don't open an empty menu: Menu can't cope with no items)
+          self._show_problems([Problem(None, "No saved programs: use Save program")], "Can't load:")
+          return
+        labels = [f"{e['name']} ({e['steps']} steps)" for e in self._library_entries]
+        self.ui_delegate = open_menu(self, "library", labels, self._handle_library_select, self._handle_library_back)
+      return self.ui_delegate.update(delta)
+    elif self._mode == TEMPO_MODE:
+      if self.ui_delegate is None:
+        self.ui_delegate = open_menu(self, "tempo", TEMPO_LABELS, self._handle_tempo_select, self._handle_tempo_back)
+      return self.ui_delegate.update(delta)
+    elif self._mode == PROBLEMS_MODE:
+      if self.ui_delegate is None:
+        self.ui_delegate = ProblemsUI(self, self._problems, self._problems_heading)
+        self._problems = []
       return self.ui_delegate.update(delta)
+    elif self._mode == REPLAY_MODE and self._trace_player is not None:
+      self._trace_player.update(time.ticks_ms())
 
   def background_update(self, delta):
     if self._mode == PLAY_MODE:
       self.either_update_PLAY(delta)
+    elif self._mode == REPLAY_MODE and self._trace_player is not None:
+      self._trace_player.update(time.ticks_ms())
 
   # this can be called as often as you like from as many tasks as
   # you like - specifically intended to be called from both update
   # and the background_update call.
   def either_update_PLAY(self, delta):
     now = time.ticks_ms()
+    if collector.DEBUG_ALLOCATIONS:
+      collector.update_begin()
+
+    # baked loops and other animations run on their own timing, not
+    # once per step.
+    if leds.animation is not None and self._mode == PLAY_MODE:
+      leds.animation.update(now)
+
     delta_ticks = time.ticks_diff(now, self._last_step_time_ms)
-    if delta_ticks >= STEP_PERIOD_MS and self._mode == PLAY_MODE:
+    # also step early if a pause has reached its deadline, so that pauses
+    # aren't made longer by waiting for the next regular step.
+    if (delta_ticks >= self._step_period_ms or clock.is_wake_due(now)) and self._mode == PLAY_MODE:
+      clock.clear_wake()
       self.do_update_PLAY(delta)
       self._last_step_time_ms = now
 
-  def do_update_PLAY(self, delta):
-
-    if self.sequence_pos < 0:
-      # nothing to run
-      pass
+    if self._mode == PLAY_MODE:
+      if collector.DEBUG_ALLOCATIONS:
+        collector.update_end(self.sequence_pos)
+      idle = self._idle_ms(now)
+      # periodically save where we are, so that a reboot can resume
+      # roughly where it left off.
+      if time.ticks_diff(now, self._last_checkpoint_ms) >= CHECKPOINT_PERIOD_MS and (idle is None or idle >= CHECKPOINT_IDLE_MS):
+        self._save_checkpoint()
+        now = time.ticks_ms()
+        idle = self._idle_ms(now)
+      collector.maybe_collect(now, idle)
+
+  def _idle_ms(self, now):
+    # How long until anything needs to happen while playing: a pause
+    # ending, the next animation frame, or, if there are steps ready to
+    # run, the next regular step. While the program is waiting, regular
+    # steps only check whether it has finished waiting, so they don't
+    # count. (In Play fast, steps are due on every update, so this is
+    # what lets garbage be collected at all.) None if nothing is due.
+    idle = None
+    if not self._waiting:
+      idle = self._step_period_ms - time.ticks_diff(now, self._last_step_time_ms)
+    if clock.wake_ms is not None:
+      wake = time.ticks_diff(clock.wake_ms, now)
+      if idle is None or wake < idle:
+        idle = wake
+    if leds.animation is not None:
+      frame = leds.animation.next_frame_ms(now)
+      if idle is None or frame < idle:
+        idle = frame
+    return idle
 
+  def do_update_PLAY(self, delta):
+    now = time.ticks_ms()
+    if time.ticks_diff(now, self._quota_window_ms) >= QUOTA_WINDOW_MS:
+      self._quota_window_ms = now
+      for when in self._when_steps:
+        when.new_quota_window()
+
+    # Run steps for as long as they finish straight away, up to
+    # _steps_per_update of them, charging each to the When block that it
+    # is part of. A throttled block waits for the next quota window.
+    n = 0
+    self._waiting = True
+    while n < self._steps_per_update and self.sequence_pos >= 0:
+      when = self.sequence[self.sequence_pos]._when
+      if when.throttled:
+        break
+      start_us = time.ticks_us()
+      moved = self._run_step()
+      when.charge(1, time.ticks_diff(time.ticks_us(), start_us))
+      if not moved:
+        break
+      n += 1
     else:
-      do_next = self.sequence[self.sequence_pos].progress_step()
-
-      # n.b. this is not the same as "if do_next:" because do_next
-      # is richer than a bool
-      if do_next is True:
-        old_pos = self.sequence_pos
-        self.sequence_pos = (self.sequence_pos + 1)
-        if self.sequence_pos >= len(self.sequence):
-          self.sequence_pos = -old_pos
-        else: 
-          assert self.sequence_pos >= 0
-          assert self.sequence_pos < len(self.sequence)
-
-          self.sequence[self.sequence_pos].enter_step()
-      elif do_next is False:
-        pass # do nothing
-      else:
-        assert isinstance(do_next, int), f"do_next not an int: {do_next}"
-        self.sequence_pos = do_next
+      # stopped with steps still ready to run, unless the program ended
+      self._waiting = self.sequence_pos < 0
+
+    timers.poll(now)
+    self._poll_whens()
+
+  def _run_step(self):
+    # Progress the current step, and enter the next one if it has
+    # finished. Returns False if the current step is still going.
+    do_next = self.sequence[self.sequence_pos].progress_step()
+
+    # n.b. this is not the same as "if do_next:" because do_next
+    # is richer than a bool
+    #
+    # There are no checks on where this goes: verify.verify has already
+    # checked that every jump a step can make lands on a step.
+    if do_next is True:
+      old_pos = self.sequence_pos
+      self.sequence_pos = (self.sequence_pos + 1)
+      if self.sequence_pos >= len(self.sequence):
+        self.sequence_pos = -old_pos
+      else: 
         self.sequence[self.sequence_pos].enter_step()
+    elif do_next is False:
+      pass # do nothing
+    else:
+      self.sequence_pos = do_next
+      self.sequence[self.sequence_pos].enter_step()
+    return do_next is not False
+
+  def _poll_whens(self):
+    # Only When steps can fire, so only they are polled. The program was
+    # verified when play started, so every When has a step after it.
+    for when in self._when_steps:
+      # throttled blocks don't fire either (and don't consume whatever
+      # would make them fire, so that they can fire later)
+      if not when.throttled and when.poll_for_when():
+        # Tell the when-block where we were before, so that we can
+        # go back there later.
+        # TODO: what are the semantics on leaving this step if its a
+        # pause step? Right now, I think we just stay entered, which is
+        # probably ok (e.g. counters will continue to count down, possibly
+        # running over). That's maybe not so good for e.g. if we were
+        # driving a buzzer?
+        when.charge(1, 0)
+        self._stop_animation()
+        when.enter_when(self.sequence_pos)
+
+        # pauses in the when-block are timed from when it fired
+        clock.set_logical(time.ticks_ms())
+
+        self.sequence_pos = when._step_number + 1
+        self.sequence[self.sequence_pos].enter_step()
+        self._waiting = False
 
-    for sn in range(0, len(self.sequence)):
-      polling_step = self.sequence[sn]
-      if polling_step.poll_for_when():
-        # guard for the when being the last statement, so there
-        # is no sn+1. In a well-formed program, there will always be a
-        # next block, so then this could become an assert not a if/skip.
-        if sn+1 < len(self.sequence):
-          # Tell the when-block where we were before, so that we can
-          # go back there later.
-          # TODO: what are the semantics on leaving this step if its a
-          # pause step? Right now, I think we just stay entered, which is
-          # probably ok (e.g. counters will continue to count down, possibly
-          # running over). That's maybe not so good for e.g. if we were
-          # driving a buzzer?
-          assert isinstance(polling_step, WhenStep)
-          polling_step.enter_when(self.sequence_pos)
-
-          self.sequence_pos = sn+1
-          self.sequence[self.sequence_pos].enter_step()
-
-          # break to avoid handling any other when blocks in
-          # the same iteration - but actually who cares? all the triggered
-          # when-blocks need to happen? this loop will accumulate them all
-          # on the stack if several fire.
-          break
-        else:
-          # ignore this when block as it does nothing.
-          pass
+        # break to avoid handling any other when blocks in
+        # the same iteration - but actually who cares? all the triggered
+        # when-blocks need to happen? this loop will accumulate them all
+        # on the stack if several fire.
+        break
  
+  def _stop_animation(self):
+    # If a baked loop is playing, hand back to the interpreter at the
+    # step the loop has got to, so that is where the interrupted program
+    # will return to.
+    if leds.animation is not None:
+      (pos, _) = leds.animation.position(time.ticks_ms())
+      leds.animation = None
+      self.sequence_pos = pos
+
   def render_step(self, ctx, render_base, offset):
     if offset == 0:
       text_colour = (255,255,0)
@@ -251,6 +548,8 @@ class ScripterApp(App):
         mode_colour = (0, 255, 0)
     elif self._mode == EDIT_MODE:
         mode_colour = (0, 0, 255)
+    elif self._mode == REPLAY_MODE:
+        mode_colour = (255, 0, 255)
     else:  # indicate bad mode
         mode_colour = (255, 0, 0)
 
@@ -288,11 +587,21 @@ class ScripterApp(App):
 
     if self._mode == PLAY_MODE and BUTTON_TYPES["CANCEL"] in event.button:
       self._mode = EDIT_MODE
+      collector.stop_play()
+      self._stop_recording()
       self._reset_steps()
       self.sequence_pos = abs(self.sequence_pos)
+      # checkpoint the stopped program, so that it comes back (not playing)
+      # next time.
+      self._save_checkpoint()
+    elif self._mode == REPLAY_MODE and BUTTON_TYPES["CANCEL"] in event.button:
+      self._trace_player = None
+      self._mode = EDIT_MODE
     elif self._mode == EDIT_MODE and BUTTON_TYPES["CANCEL"] in event.button: 
+      self._save_checkpoint()
       eventbus.remove(ButtonDownEvent, self._handle_buttondown, self)
       eventbus.emit(PatternEnable())
+      collector.set_foreground(False)
       self.minimise()
     elif self._mode == EDIT_MODE and BUTTON_TYPES["UP"] in event.button: 
       if self.sequence_pos > 0:
@@ -312,6 +621,8 @@ class ScripterApp(App):
       print("Switching to MENU mode")
     elif self._mode == MENU_MODE:
       pass # menu will handle its own button events, we should stay out of the way
+    elif self._mode == PROBLEMS_MODE:
+      pass # ProblemsUI handles its own button events
     else:
       print(f"Unknown button event - ignoring - mode {self._mode}, event {event}")
 
@@ -334,18 +645,32 @@ class ScripterApp(App):
       # switch back to play mode 
       self.ui_delegate._cleanup()
       self.ui_delegate = None
-      self.sequence_pos = -1
-      self._mode = PLAY_MODE
+      self._start_play()
+    elif item == "Play fast":
+      self.ui_delegate._cleanup()
+      self.ui_delegate = None
+      self._start_play(fast=True)
     elif item == "Play in background":
       # start playing...
       self.ui_delegate._cleanup()
       self.ui_delegate = None
-      self.sequence_pos = -1
-      self._mode = PLAY_MODE
-      # but also minimise, without restoring a bunch of state
-      # like patterns or other events, so that things still play.
-      eventbus.remove(ButtonDownEvent, self._handle_buttondown, self)
-      self.minimise()
+      if self._start_play():
+        # but also minimise, without restoring a bunch of state
+        # like patterns or other events, so that things still play.
+        eventbus.remove(ButtonDownEvent, self._handle_buttondown, self)
+        collector.set_foreground(False)
+        self.minimise()
+    elif item == "Play and record":
+      self.ui_delegate._cleanup()
+      self.ui_delegate = None
+      self._start_recording()
+      if not self._start_play():
+        self._stop_recording()
+    elif item == "Replay recording":
+      self.ui_delegate._cleanup()
+      self.ui_delegate = None
+      self._mode = EDIT_MODE
+      self._start_replay()
     elif item == "Delete step":
       # This should delete the current step and everything enclosed,
       # if it is a block:
@@ -384,7 +709,7 @@ class ScripterApp(App):
            
           assert end_step_obj._start_step == self.sequence[self.sequence_pos]
 
-          del self.sequence[self.sequence_pos:end_step_pos+1] 
+          self.delete_steps(self.sequence_pos, end_step_pos)
 
           # postconditions on well-formedness 
           self._reset_steps()
@@ -397,7 +722,7 @@ class ScripterApp(App):
           assert self.sequence_pos < len(self.sequence)
 
           # delete current step then switch back to edit mode
-          del self.sequence[self.sequence_pos]
+          self.delete_steps(self.sequence_pos, self.sequence_pos)
 
           # BUG: this is going to break when deleting all steps so that
           # the sequence list is empty. Probably other bits of the
@@ -414,6 +739,31 @@ class ScripterApp(App):
       self.ui_delegate._cleanup()
       self.ui_delegate = None
       self._mode = EDIT_MODE
+    elif item == "Undo" or item == "Redo":
+      if item == "Undo":
+        self._apply_history(self.history.undo(self.sequence))
+      else:
+        self._apply_history(self.history.redo(self.sequence))
+      self.ui_delegate._cleanup()
+      self.ui_delegate = None
+      self._mode = EDIT_MODE
+    elif item == "Save program":
+      self.ui_delegate._cleanup()
+      self.ui_delegate = None
+      self._mode = EDIT_MODE
+      try:
+        self.program_name = library.save_program(self.sequence, self.program_name)
+        print(f"Saved program as {self.program_name}")
+      except OSError as e:
+        self._show_problems([Problem(None, str(e))], "Can't save the program:")
+    elif item == "Load program":
+      self.ui_delegate._cleanup()
+      self.ui_delegate = None
+      self._mode = LIBRARY_MODE
+    elif item == "Set tempo":
+      self.ui_delegate._cleanup()
+      self.ui_delegate = None
+      self._mode = TEMPO_MODE
     elif item == "Insert step":
       self.ui_delegate._cleanup()
       self.ui_delegate = None
@@ -421,6 +771,68 @@ class ScripterApp(App):
     else:
       print("Selected menu item is unhandled - ignoring")
 
+  def _main_menu_items(self):
+    # Undo and Redo are only offered when there is something to undo or
+    # redo.
+    return [item for item in MAIN_MENU_ITEMS
+            if (item != "Undo" or self.history.can_undo()) and (item != "Redo" or self.history.can_redo())]
+
+  def _handle_library_select(self, item, idx):
+    entry = self._library_entries[idx]
+    self._handle_library_back()
+    self.switch_program(entry)
+
+  def _handle_library_back(self):
+    self._library_entries = []
+    assert isinstance(self.ui_delegate, Menu), "in library mode, the UI delegate should be Menu"
+    self.ui_delegate._cleanup()
+    self.ui_delegate = None
+    self._mode = EDIT_MODE
+
+  def switch_program(self, entry):
+    """Replace the current program with one from the program library."""
+    heading = f"Can't load {entry['name']}:"
+    try:
+      data = library.read_program(entry)
+    except (OSError, ValueError) as e:
+      self._show_problems([Problem(None, str(e))], heading)
+      return
+
+    # The checksum only catches corruption: a program written by a newer
+    # version of the app, or by another tool, can still have step types
+    # or parameters that this version doesn't understand. Check before
+    # letting go of the current program, so that it is kept if the new
+    # one can't be loaded. (The problems' step numbers are in the other
+    # program, so they are only shown, not gone to.)
+    problems = check_data(data)
+    if len(problems) > 0:
+      self._show_problems([Problem(None, str(p)) for p in problems], heading)
+      return
+
+    # let go of the old program before building the new one, so that
+    # both don't need to fit in memory at once.
+    for step in self.sequence:
+      step.release()
+    self.sequence = []
+    self.history.clear()
+    params.clear()
+    gc.collect()
+
+    self.sequence = program_from_data(self, data)
+    self.sequence_pos = 0
+    self.program_name = entry["name"]
+    self._reset_steps()
+
+  def _handle_tempo_select(self, item, idx):
+    clock.bpm = TEMPO_CHOICES[idx]
+    self._handle_tempo_back()
+
+  def _handle_tempo_back(self):
+    assert isinstance(self.ui_delegate, Menu), "in tempo mode, the UI delegate should be Menu"
+    self.ui_delegate._cleanup()
+    self.ui_delegate = None
+    self._mode = EDIT_MODE
+
 __app_export__ = ScripterApp
 
 
@@ -431,9 +843,12 @@ class InsertStepUI:
     # TODO: types of UI delegate
     self.ui_delegate: Any
 
-    # TODO: generate this list from step class registrations
-    # somehow - rather than hard-coding here.
-    self.ui_delegate = Menu(self.app, ["Set LEDs", "Pause", "Count loops", "When button pushed", "When badge goes upright", "When play starts", "Repeat forever"], select_handler=self._handle_menu_select, back_handler=self._handle_menu_back)
+    self._labels = registry.menu_labels()
+    self.open()
+
+  def open(self):
+    """Start choosing a step type, for reuse after a previous insert."""
+    self.ui_delegate = open_menu(self.app, "step types", self._labels, self._handle_menu_select, self._handle_menu_back)
 
   def update(self, delta):
     self.ui_delegate.update(delta)
@@ -455,22 +870,8 @@ class InsertStepUI:
     # clean up our downstream delegate
     self.ui_delegate._cleanup()
 
-    if item == "Set LEDs":
-      self.ui_delegate = InsertLEDStepUI(self.app)
-    elif item == "Pause":
-      self.ui_delegate = InsertPauseStepUI(self.app)
-    elif item == "Count loops":
-      self.ui_delegate = InsertCountLoopsUI(self.app)
-    elif item == "When button pushed":
-      self.ui_delegate = InsertWhenButtonPushedUI(self.app)
-    elif item == "Repeat forever":
-      self.ui_delegate = InsertRepeatForeverStepUI(self.app)
-    elif item == "When badge goes upright":
-      self.ui_delegate = InsertIMUUpright(self.app)
-    elif item == "When play starts":
-      self.ui_delegate = InsertWhenPlayStepUI(self.app)
-    else:
-      assert False, "No UI to create this step type"
+    # this will import the step's module if it hasn't been used yet
+    self.ui_delegate = registry.step_type_for_label(item).make_insert_ui(self.app)
 
   def _handle_menu_back(self):
     # clean up our downstream delegate
@@ -0,0 +1,133 @@
+# Baking deterministic loops into keyframe tables.
+#
+# A "Repeat forever" block whose body is only Set LEDs and Pause steps
+# always does exactly the same thing, so rather than interpreting it
+# step by step, it can be precomputed into a table of keyframes: the
+# time offset into the loop, and what the LEDs change to at that time.
+# A BakedLoop then plays that table on its own timing, driven from
+# leds.animation, without the interpreter stepping through the body.
+#
+# If a When-block interrupts a baked loop, position() maps the current
+# time in the loop back to the equivalent interpreter position (a pause
+# step, part way through), so that interpretation can take over.
+
+import time
+
+from . import leds
+
+# step type names that can be baked
+_BAKEABLE = ("led", "pause")
+
+
+class BakedLoop:
+  def __init__(self, keyframes, pauses, period_ms):
+    # keyframes: list of (offset_ms, mask, frame) where frame has the
+    # colours for the LEDs set in mask.
+    self.keyframes = keyframes
+    # pauses: list of (offset_ms, step number) for each pause step with a
+    # non-zero duration, so that a time in the loop can be mapped back to
+    # a step.
+    self.pauses = pauses
+    self.period_ms = period_ms
+    self._start_ms = 0
+    self._next = 0
+
+  def start(self, now, phase=0):
+    """Start playing at phase ms into the loop."""
+    self._start_ms = time.ticks_add(now, -phase)
+    # apply all the keyframes up to phase, so that the frame is right
+    # even when starting part way through.
+    self._next = 0
+    self.update(now)
+
+  def phase(self, now):
+    return time.ticks_diff(now, self._start_ms)
+
+  def update(self, now):
+    keyframes = self.keyframes
+    elapsed = time.ticks_diff(now, self._start_ms)
+    changed = False
+    while keyframes[self._next][0] <= elapsed:
+      (_, mask, frame) = keyframes[self._next]
+      _apply(mask, frame)
+      changed = True
+      self._next += 1
+      if self._next >= len(keyframes):
+        # go round again, moving the start time forward by exactly
+        # one period so that the loop doesn't drift.
+        self._next = 0
+        self._start_ms = time.ticks_add(self._start_ms, self.period_ms)
+        elapsed -= self.period_ms
+    if changed:
+      leds.show()
+
+  def next_frame_ms(self, now):
+    """How long until the LEDs next change."""
+    return self.keyframes[self._next][0] - time.ticks_diff(now, self._start_ms)
+
+  def position(self, now):
+    """Return (step number, ms into that step) that the interpreter would
+    be at now."""
+    phase = self.phase(now)
+    (offset, n) = self.pauses[0]
+    for p in self.pauses:
+      if p[0] > phase:
+        break
+      (offset, n) = p
+    return (n, phase - offset)
+
+
+def _apply(mask, frame):
+  # byte by byte rather than by slices, which would allocate
+  out = leds.frame
+  for n in range(0, leds.NUM_LEDS):
+    if mask & (1 << n):
+      i = n * 3
+      out[i] = frame[i]
+      out[i+1] = frame[i+1]
+      out[i+2] = frame[i+2]
+
+
+def bake_loop(sequence, start, end):
+  """Bake the body of the block from start to end (the positions of its
+  first and end steps), or return None if it can't be baked."""
+  body = sequence[start+1:end]
+  if len(body) == 0:
+    return None
+  for step in body:
+    if step.type_name not in _BAKEABLE:
+      return None
+    if step.type_name == "pause" and step.beats != 0:
+      # beat pauses depend on the tempo and the beat grid
+      return None
+
+  keyframes = []
+  pauses = []
+  offset = 0
+  mask = 0
+  frame = bytearray(leds.NUM_LEDS * 3)
+  for step in body:
+    if step.type_name == "led":
+      for n in step.leds:
+        mask |= 1 << n
+        frame[n*3] = step.rgb[0]
+        frame[n*3+1] = step.rgb[1]
+        frame[n*3+2] = step.rgb[2]
+    elif step.ms > 0:
+      if mask != 0:
+        keyframes.append((offset, mask, bytes(frame)))
+        mask = 0
+      pauses.append((offset, step._step_number))
+      offset += step.ms
+
+  if offset == 0:
+    # the loop takes no time: there's nothing sensible to play
+    return None
+  if mask != 0:
+    # LEDs set at the very end of the loop body happen at the same time
+    # as the start of the next time round.
+    keyframes.append((offset, mask, bytes(frame)))
+  if len(keyframes) == 0:
+    return None
+
+  return BakedLoop(keyframes, pauses, offset)
@@ -0,0 +1,55 @@
+# The routine call stack, shared by all steps. A Call routine step
+# pushes the position to return to and jumps into the routine, and the
+# end of the routine pops it again. This is separate from When blocks'
+# interrupt stacks: a When can fire part way through a routine, and call
+# routines itself, and both unwind in order.
+#
+# The stack is allocated up front, so that calls don't allocate while
+# playing.
+
+MAX_CALL_DEPTH = 16
+
+stack = [0] * MAX_CALL_DEPTH
+depth = 0
+# how many calls have been skipped because the stack was full, since
+# the last reset
+overflows = 0
+
+
+def reset():
+  global depth, overflows
+  depth = 0
+  overflows = 0
+
+
+def push(pos):
+  """Push a position to return to. Returns False, without pushing, if
+  the stack is full."""
+  global depth, overflows
+  if depth == MAX_CALL_DEPTH:
+    overflows += 1
+    return False
+  stack[depth] = pos
+  depth += 1
+  return True
+
+
+def pop():
+  """Pop the position to return to, or return -1 if the stack is
+  empty."""
+  global depth
+  if depth == 0:
+    return -1
+  depth -= 1
+  return stack[depth]
+
+
+def save():
+  return stack[0:depth]
+
+
+def restore(saved):
+  global depth
+  saved = saved[0:MAX_CALL_DEPTH]
+  stack[0:len(saved)] = saved
+  depth = len(saved)
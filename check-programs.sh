@@ -0,0 +1,8 @@
+# Check a directory of saved programs, using the simulator's stand-in
+# hardware modules. Usage: ./check-programs.sh <directory> [options]
+
+source ~/src/badge-2024-software/venv-testing/bin/activate
+
+export PYTHONPATH=/home/benc/src/badge-2024-software/sim/fakes/:/home/benc/src/badge-2024-software/modules
+
+python3 "$(dirname "$0")/tools/check_programs.py" "$@"
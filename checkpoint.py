@@ -0,0 +1,100 @@
+# Checkpoints of the whole interpreter state: the program, the program
+# counter, per-step runtime state (interrupt stacks, counters, pause
+# deadlines), the routine call stack and the LED frame. A checkpoint can
+# be saved to flash and restored in one step, so that a program resumes
+# where it was after an app switch or reboot rather than cold starting.
+
+import json
+import time
+
+from . import calls
+from . import clock
+from . import leds
+from . import variables
+from .const import SAVE_DIR, PLAY_MODE
+from .files import ensure_save_dir, replace_file
+from .program import program_to_data, program_from_data
+
+CHECKPOINT_VERSION = 1
+CHECKPOINT_FILE = SAVE_DIR + "/checkpoint.json"
+
+
+def make_checkpoint(app, now):
+  # states are kept by position in the program, rather than by the
+  # steps' own numbers, which are only set when the program is linked
+  # and so can be out of date after an edit.
+  step_states = []
+  for (n, step) in enumerate(app.sequence):
+    state = step.save_state(now)
+    if state is not None:
+      step_states.append([n, state])
+
+  return {"version": CHECKPOINT_VERSION,
+          "program": program_to_data(app.sequence),
+          "name": app.program_name,
+          "playing": app._mode == PLAY_MODE,
+          "pos": app.sequence_pos,
+          "steps": step_states,
+          "leds": list(leds.frame),
+          "variables": list(variables.registers),
+          "calls": calls.save(),
+          "clock": [clock.bpm,
+                    time.ticks_diff(clock.play_epoch_ms, now),
+                    time.ticks_diff(clock.logical_ms, now)]}
+
+
+def restore_checkpoint(app, checkpoint, now):
+  """Replace the app's program and runtime state with those from a
+  checkpoint. Returns True if the checkpoint should continue playing.
+
+  This does not change the app's mode."""
+  if checkpoint.get("version") != CHECKPOINT_VERSION:
+    raise ValueError(f"Unsupported checkpoint version {checkpoint.get('version')}")
+
+  app.sequence = program_from_data(app, checkpoint["program"])
+  app.program_name = checkpoint["name"]
+  app.history.clear()
+
+  # link blocks and reset all steps, then lay the saved state on top.
+  # The LED frame goes first, because steps such as fades carry on from
+  # what the LEDs were showing.
+  app._reset_steps()
+  leds.set_frame(checkpoint["leds"])
+  for (n, state) in checkpoint["steps"]:
+    app.sequence[n].restore_state(state, now)
+
+  app.sequence_pos = checkpoint["pos"]
+
+  for (n, value) in enumerate(checkpoint["variables"]):
+    variables.registers[n] = value
+
+  # (checkpoints from before routines don't have a call stack)
+  calls.restore(checkpoint.get("calls", []))
+
+  (clock.bpm, epoch, logical) = checkpoint["clock"]
+  clock.play_epoch_ms = time.ticks_add(now, epoch)
+  clock.logical_ms = time.ticks_add(now, logical)
+
+  leds.show()
+
+  return checkpoint["playing"]
+
+
+def save_checkpoint(checkpoint, path=CHECKPOINT_FILE):
+  ensure_save_dir()
+  tmp_path = path + ".tmp"
+  with open(tmp_path, "w") as f:
+    json.dump(checkpoint, f)
+  replace_file(tmp_path, path)
+
+
+def load_checkpoint(path=CHECKPOINT_FILE):
+  """Return the saved checkpoint, or None if there isn't a usable one."""
+  try:
+    with open(path) as f:
+      return json.load(f)
+  except OSError:
+    return None
+  except ValueError as e:
+    print(f"Ignoring unreadable checkpoint: {e}")
+    return None
@@ -0,0 +1,89 @@
+# Program timing.
+#
+# Pauses are timed from deadlines rather than from when they happened
+# to be noticed: the clock keeps the logical time that the program has
+# got to, and each pause ends at exactly its duration after the previous
+# pause ended. Lateness in noticing a pause has finished (waiting for the
+# next step, or for other steps to run) is then made up by the next pause,
+# instead of adding up over every time round a loop.
+#
+# There is also a tempo, in beats per minute, so that pauses can be
+# given in beats. Pauses in beats end on the beat grid, which starts when
+# play starts.
+
+import time
+
+DEFAULT_BPM = 120
+
+# If the program gets this far behind its deadlines (because steps
+# take longer than the pauses between them), give up on catching up
+# and carry on from now, rather than rushing through the following
+# pauses.
+MAX_LAG_MS = 1000
+
+bpm = DEFAULT_BPM
+
+# ticks_ms when play started: the origin of the beat grid
+play_epoch_ms = 0
+
+# ticks_ms that the program has logically got to
+logical_ms = 0
+
+# ticks_ms of the earliest deadline that a step is waiting for, so that
+# the app can run the step as soon as it is due rather than on the next
+# regular step. None if nothing is waiting.
+wake_ms = None
+
+
+def start_play(now):
+  global play_epoch_ms, logical_ms, wake_ms
+  play_epoch_ms = now
+  logical_ms = now
+  wake_ms = None
+
+
+def beat_ms():
+  return 60000 // bpm
+
+
+def set_logical(now):
+  """Something happened at now (such as a When-block firing) that
+  following pauses should be timed from."""
+  global logical_ms
+  logical_ms = now
+
+
+def deadline_after(ms, beats):
+  """Deadline for a pause of ms, or of beats if beats is not 0, that
+  starts at the current logical time."""
+  if beats == 0:
+    return time.ticks_add(logical_ms, ms)
+  beat = beat_ms()
+  end = time.ticks_diff(logical_ms, play_epoch_ms) + beats * beat
+  # snap to the nearest beat, so that beat pauses stay on the grid
+  end = ((end + beat // 2) // beat) * beat
+  return time.ticks_add(play_epoch_ms, end)
+
+
+def wake_at(deadline):
+  global wake_ms
+  if wake_ms is None or time.ticks_diff(deadline, wake_ms) < 0:
+    wake_ms = deadline
+
+
+def is_wake_due(now):
+  return wake_ms is not None and time.ticks_diff(now, wake_ms) >= 0
+
+
+def clear_wake():
+  global wake_ms
+  wake_ms = None
+
+
+def pause_finished(deadline, now):
+  """A pause with this deadline was noticed to have finished at now."""
+  global logical_ms
+  if time.ticks_diff(now, deadline) < MAX_LAG_MS:
+    logical_ms = deadline
+  else:
+    logical_ms = now
@@ -0,0 +1,161 @@
+# Garbage collection scheduling while playing.
+#
+# MicroPython collects garbage whenever an allocation needs it, which
+# can be in the middle of an animation, where the pause shows as a
+# stutter on the LEDs. So while playing, automatic collection is turned
+# off and the app calls maybe_collect after every update, which collects
+# only at safe points: when nothing needs to happen for a while (a long
+# pause, or a gap between animation frames). If free memory gets low,
+# it collects straight away whatever is happening, because with
+# automatic collection off, running out of memory is an error rather
+# than a collection.
+#
+# Turning automatic collection off affects the whole VM, not just this
+# app, so it is only off while playing with the app in the foreground.
+# When another app is in the foreground, it gets automatic collection
+# back, and the program playing in the background just has to put up
+# with it.
+#
+# The play loop aims not to allocate at all, so that there is rarely
+# anything to collect. With DEBUG_ALLOCATIONS set, every update that
+# does allocate is reported. The one thing that can't avoid it is
+# reading the IMU, because the driver returns a new tuple each time, so
+# "When badge goes upright" only reads it every steps.imu.POLL_PERIOD_MS.
+#
+# CPython's gc module doesn't have mem_alloc or mem_free, so on the host
+# collections happen every COLLECT_PERIOD_MS at safe points instead.
+
+import gc
+import time
+
+# Report updates that allocate. Measuring is cheap, but the reports
+# themselves allocate.
+DEBUG_ALLOCATIONS = False
+
+# Only collect at a safe point if nothing needs to happen for this long.
+SAFE_IDLE_MS = 40
+
+# Don't bother collecting at a safe point until at least this much has
+# been allocated since the last collection.
+GARBAGE_BYTES = 8 * 1024
+
+# Collect immediately if free memory drops below this.
+LOW_MEMORY_BYTES = 16 * 1024
+
+# Where allocation can't be measured, how often to collect.
+COLLECT_PERIOD_MS = 5000
+
+# (mem_alloc and mem_free are MicroPython's, hence the type: ignores)
+_can_measure = hasattr(gc, "mem_alloc") and hasattr(gc, "mem_free")
+
+# automatic collection is off while both of these are True
+_playing = False
+_foreground = True
+
+# allocated memory after the last collection
+_alloc_base = 0
+_last_collect_ms = 0
+
+# allocated memory at the start of the current update, when debugging
+_tick_alloc = 0
+
+# statistics for the current (or most recent) play
+collections = 0
+forced_collections = 0
+collect_ms_total = 0
+collect_ms_max = 0
+allocating_updates = 0
+update_alloc_max = 0
+
+
+def _allocated():
+  return gc.mem_alloc() if _can_measure else 0  # type: ignore
+
+
+def _set_automatic():
+  if _playing and _foreground:
+    gc.disable()
+  else:
+    gc.enable()
+
+
+def set_foreground(foreground):
+  """Tell the collector whether the app is in the foreground."""
+  global _foreground
+  _foreground = foreground
+  _set_automatic()
+
+
+def start_play():
+  global collections, forced_collections, _playing
+  global collect_ms_total, collect_ms_max, allocating_updates, update_alloc_max
+  # start from a clean heap, so that play can go as long as possible
+  # before it needs to collect.
+  _collect()
+  _playing = True
+  _set_automatic()
+  collections = 0
+  forced_collections = 0
+  collect_ms_total = 0
+  collect_ms_max = 0
+  allocating_updates = 0
+  update_alloc_max = 0
+
+
+def stop_play():
+  global _playing
+  _playing = False
+  _set_automatic()
+  print(f"GC while playing: {collections} collections ({forced_collections} forced), "
+        f"{collect_ms_total}ms total, {collect_ms_max}ms longest")
+  if DEBUG_ALLOCATIONS:
+    print(f"{allocating_updates} updates allocated, at most {update_alloc_max} bytes")
+
+
+def _collect():
+  global _alloc_base, _last_collect_ms, collections, collect_ms_total, collect_ms_max
+  start = time.ticks_ms()
+  gc.collect()
+  end = time.ticks_ms()
+  took = time.ticks_diff(end, start)
+  collections += 1
+  collect_ms_total += took
+  if took > collect_ms_max:
+    collect_ms_max = took
+  _alloc_base = _allocated()
+  _last_collect_ms = end
+
+
+def maybe_collect(now, idle_ms):
+  """Collect if it is safe and worthwhile to. idle_ms is how long until
+  anything next needs to happen, or None if nothing is waiting."""
+  global forced_collections
+  if _can_measure and gc.mem_free() < LOW_MEMORY_BYTES:  # type: ignore
+    forced_collections += 1
+    _collect()
+    return
+  if idle_ms is not None and idle_ms < SAFE_IDLE_MS:
+    return
+  if _can_measure:
+    due = gc.mem_alloc() - _alloc_base >= GARBAGE_BYTES  # type: ignore
+  else:
+    due = time.ticks_diff(now, _last_collect_ms) >= COLLECT_PERIOD_MS
+  if due:
+    _collect()
+
+
+def update_begin():
+  global _tick_alloc
+  _tick_alloc = _allocated()
+
+
+def update_end(pos):
+  """Report if anything was allocated since update_begin. pos is where
+  the program has got to, to help find what allocated."""
+  global allocating_updates, update_alloc_max
+  allocated = _allocated() - _tick_alloc
+  if allocated > 0:
+    allocating_updates += 1
+    if allocated > update_alloc_max:
+      update_alloc_max = allocated
+    print(f"Play update allocated {allocated} bytes, at step {pos}")
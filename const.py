@@ -4,3 +4,14 @@ PLAY_MODE = 0
 EDIT_MODE = 1
 MENU_MODE = 2
 INSERT_STEP_MODE = 3
+REPLAY_MODE = 4
+TEMPO_MODE = 5
+LIBRARY_MODE = 6
+PROBLEMS_MODE = 7
+
+# Where the app keeps its files on the badge filesystem
+SAVE_DIR = "/scripter"
+
+# How often animated steps (fades, gradients) update the LEDs. This is
+# independent of how often the program steps.
+ANIMATION_FRAME_MS = 20
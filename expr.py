@@ -0,0 +1,207 @@
+# Integer expressions over program variables.
+#
+# Expressions are written as text, such as "A + 1" or "B * 2 > A", and
+# compiled once (when the step that uses them is created) into a flat
+# tuple of opcodes for a small stack machine. Evaluating the compiled
+# form does no parsing, string handling or allocation, so it is cheap
+# enough to do on every tick.
+#
+# Supported: integer constants, variables A-H, unary -, + - * / %,
+# and comparisons = != < > <= >= which give 1 for true and 0 for false.
+# Division is integer division, and dividing by zero gives 0 rather
+# than stopping the program.
+
+from . import variables
+
+# opcodes. CONST and VAR are followed by their operand.
+CONST = 0
+VAR = 1
+NEG = 2
+ADD = 3
+SUB = 4
+MUL = 5
+DIV = 6
+MOD = 7
+EQ = 8
+NE = 9
+LT = 10
+GT = 11
+LE = 12
+GE = 13
+
+MAX_STACK = 16
+
+_BINARY_OPS = {"+": ADD, "-": SUB, "*": MUL, "/": DIV, "%": MOD,
+               "=": EQ, "!=": NE, "<": LT, ">": GT, "<=": LE, ">=": GE}
+
+_COMPARISONS = ("=", "!=", "<", ">", "<=", ">=")
+
+# preallocated evaluation stack
+_stack = [0] * MAX_STACK
+
+
+def _tokenise(src):
+  tokens = []
+  i = 0
+  while i < len(src):
+    c = src[i]
+    if c == " ":
+      i += 1
+    elif c.isdigit():
+      j = i
+      while j < len(src) and src[j].isdigit():
+        j += 1
+      tokens.append(int(src[i:j]))
+      i = j
+    elif src[i:i+2] in ("!=", "<=", ">="):
+      tokens.append(src[i:i+2])
+      i += 2
+    elif c in "+-*/%=<>()":
+      tokens.append(c)
+      i += 1
+    elif variables.variable_number(c) >= 0:
+      tokens.append(c)
+      i += 1
+    else:
+      raise ValueError(f"Unexpected character {c!r} in expression {src!r}")
+  return tokens
+
+
+class _Parser:
+  def __init__(self, src):
+    self.src = src
+    self.tokens = _tokenise(src)
+    self.pos = 0
+    self.code: list[int] = []
+    self.depth = 0
+    self.max_depth = 0
+
+  def peek(self):
+    if self.pos < len(self.tokens):
+      return self.tokens[self.pos]
+    return None
+
+  def take(self):
+    t = self.peek()
+    if t is None:
+      raise ValueError(f"Unexpected end of expression {self.src!r}")
+    self.pos += 1
+    return t
+
+  def push(self):
+    self.depth += 1
+    if self.depth > self.max_depth:
+      self.max_depth = self.depth
+
+  def binary(self, token):
+    self.code.append(_BINARY_OPS[token])
+    self.depth -= 1
+
+  def comparison(self):
+    self.additive()
+    while self.peek() in _COMPARISONS:
+      t = self.take()
+      self.additive()
+      self.binary(t)
+
+  def additive(self):
+    self.multiplicative()
+    while self.peek() in ("+", "-"):
+      t = self.take()
+      self.multiplicative()
+      self.binary(t)
+
+  def multiplicative(self):
+    self.unary()
+    while self.peek() in ("*", "/", "%"):
+      t = self.take()
+      self.unary()
+      self.binary(t)
+
+  def unary(self):
+    if self.peek() == "-":
+      self.take()
+      self.unary()
+      self.code.append(NEG)
+    else:
+      self.primary()
+
+  def primary(self):
+    t = self.take()
+    if isinstance(t, int):
+      self.code.append(CONST)
+      self.code.append(t)
+      self.push()
+    elif t == "(":
+      self.comparison()
+      if self.take() != ")":
+        raise ValueError(f"Expected ) in expression {self.src!r}")
+    elif isinstance(t, str) and variables.variable_number(t) >= 0:
+      self.code.append(VAR)
+      self.code.append(variables.variable_number(t))
+      self.push()
+    else:
+      raise ValueError(f"Unexpected {t!r} in expression {self.src!r}")
+
+
+def compile_expr(src):
+  """Compile expression text into opcodes for evaluate. Raises
+  ValueError if the expression is malformed."""
+  p = _Parser(src)
+  p.comparison()
+  if p.peek() is not None:
+    raise ValueError(f"Unexpected {p.peek()!r} in expression {src!r}")
+  if p.max_depth > MAX_STACK:
+    raise ValueError(f"Expression too deeply nested: {src!r}")
+  return tuple(p.code)
+
+
+def evaluate(code):
+  """Evaluate compiled code against the current variables."""
+  regs = variables.registers
+  stack = _stack
+  sp = 0
+  pc = 0
+  n = len(code)
+  while pc < n:
+    op = code[pc]
+    if op == CONST:
+      stack[sp] = code[pc+1]
+      sp += 1
+      pc += 2
+    elif op == VAR:
+      stack[sp] = regs[code[pc+1]]
+      sp += 1
+      pc += 2
+    elif op == NEG:
+      stack[sp-1] = -stack[sp-1]
+      pc += 1
+    else:
+      sp -= 1
+      b = stack[sp]
+      a = stack[sp-1]
+      if op == ADD:
+        a = a + b
+      elif op == SUB:
+        a = a - b
+      elif op == MUL:
+        a = a * b
+      elif op == DIV:
+        a = a // b if b != 0 else 0
+      elif op == MOD:
+        a = a % b if b != 0 else 0
+      elif op == EQ:
+        a = 1 if a == b else 0
+      elif op == NE:
+        a = 1 if a != b else 0
+      elif op == LT:
+        a = 1 if a < b else 0
+      elif op == GT:
+        a = 1 if a > b else 0
+      elif op == LE:
+        a = 1 if a <= b else 0
+      else:  # GE
+        a = 1 if a >= b else 0
+      stack[sp-1] = a
+      pc += 1
+  return stack[0]
@@ -0,0 +1,24 @@
+# Helpers for the app's files on the badge filesystem.
+
+import os
+
+from .const import SAVE_DIR
+
+
+def ensure_save_dir():
+  try:
+    os.mkdir(SAVE_DIR)
+  except OSError:
+    pass  # already exists
+
+
+def replace_file(tmp_path, path):
+  """Move tmp_path over path. Writing to a temporary file then
+  replacing means a reboot part way through writing doesn't leave a
+  corrupt file behind."""
+  try:
+    os.rename(tmp_path, path)
+  except OSError:
+    # some filesystems won't rename over an existing file
+    os.remove(path)
+    os.rename(tmp_path, path)
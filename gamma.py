@@ -0,0 +1,13 @@
+# Gamma lookup tables, for fading between colours so that brightness
+# changes look even to the eye.
+#
+# DEGAMMA maps an LED value (0-255) to a perceived brightness (0-255),
+# and GAMMA maps back. Interpolating between two perceived brightnesses
+# and looking the result up in GAMMA gives a smooth looking fade using
+# only integer arithmetic and table lookups. The tables are computed
+# once, at import.
+
+GAMMA_EXPONENT = 2.2
+
+GAMMA = bytes([int(((i / 255) ** GAMMA_EXPONENT) * 255 + 0.5) for i in range(0, 256)])
+DEGAMMA = bytes([int(((i / 255) ** (1 / GAMMA_EXPONENT)) * 255 + 0.5) for i in range(0, 256)])
@@ -0,0 +1,90 @@
+# Edit history for undo/redo of program edits.
+#
+# Rather than snapshotting the whole program on every edit (which is
+# not affordable on the badge), each history entry records only the
+# range of steps that an edit inserted or removed, and where. Undoing
+# or redoing an entry splices that range back in or out of the
+# sequence, so the cost is proportional to the size of the edit, not
+# the size of the program.
+
+# An entry is a tuple of (kind, pos, steps)
+INSERT = 0
+DELETE = 1
+
+# Memory budget: the total number of steps referenced by all history
+# entries, and the maximum number of entries. When either is exceeded
+# the oldest entries are evicted.
+HISTORY_MAX_STEPS = 64
+HISTORY_MAX_ENTRIES = 16
+
+
+class EditHistory:
+  def __init__(self, max_steps=HISTORY_MAX_STEPS, max_entries=HISTORY_MAX_ENTRIES):
+    self.max_steps = max_steps
+    self.max_entries = max_entries
+    self._undo: list = []
+    self._redo: list = []
+    # number of steps referenced by entries in both lists
+    self._held = 0
+
+  def record_insert(self, pos, steps):
+    self._record((INSERT, pos, steps))
+
+  def record_delete(self, pos, steps):
+    self._record((DELETE, pos, steps))
+
+  def _record(self, entry):
+    # a new edit invalidates anything that could have been redone
+    for e in self._redo:
+      self._held -= len(e[2])
+    self._redo = []
+
+    self._undo.append(entry)
+    self._held += len(entry[2])
+
+    # Evict oldest entries first. The entry just recorded is always kept,
+    # even if on its own it is bigger than the budget: losing a large
+    # deleted block is exactly the case undo is most wanted for, and those
+    # steps were in the program a moment ago anyway.
+    while len(self._undo) > 1 and (self._held > self.max_steps or len(self._undo) > self.max_entries):
+      evicted = self._undo.pop(0)
+      self._held -= len(evicted[2])
+
+  def can_undo(self):
+    return len(self._undo) > 0
+
+  def can_redo(self):
+    return len(self._redo) > 0
+
+  def undo(self, sequence):
+    """Reverse the most recent edit on sequence. Returns a suggested
+    cursor position, or None if there was nothing to undo."""
+    if not self._undo:
+      return None
+    entry = self._undo.pop()
+    self._redo.append(entry)
+    (kind, pos, steps) = entry
+    if kind == INSERT:
+      del sequence[pos:pos+len(steps)]
+    else:
+      sequence[pos:pos] = steps
+    return pos
+
+  def redo(self, sequence):
+    """Re-apply the most recently undone edit on sequence. Returns a
+    suggested cursor position, or None if there was nothing to redo."""
+    if not self._redo:
+      return None
+    entry = self._redo.pop()
+    self._undo.append(entry)
+    (kind, pos, steps) = entry
+    if kind == INSERT:
+      sequence[pos:pos] = steps
+    else:
+      del sequence[pos:pos+len(steps)]
+    return pos
+
+  def clear(self):
+    self._undo = []
+    self._redo = []
+    self._held = 0
@@ -0,0 +1,83 @@
+# The LED frame: a copy of what the program has written to the LEDs,
+# so that it can be saved in checkpoints (and generally inspected)
+# without reading back from the hardware.
+#
+# Steps should write LEDs through here rather than directly to
+# tildagonos.leds.
+
+import time
+
+from tildagonos import tildagonos
+
+import platform
+if hasattr(platform, "python_implementation") and platform.python_implementation() == 'CPython':
+    from typing import TYPE_CHECKING, Any, Optional
+    if TYPE_CHECKING:
+        # (only for the type checker: trace imports this module)
+        from .trace import TraceRecorder
+
+NUM_LEDS = 12
+
+# all the LEDs, for set_leds
+ALL_LEDS = range(0, NUM_LEDS)
+
+# 3 bytes (r, g, b) per LED
+frame = bytearray(NUM_LEDS * 3)
+
+# If set, a trace.TraceRecorder that is given every frame written by show
+recorder: "Optional[TraceRecorder]" = None
+
+# If set, something driving the LEDs on its own timing, such as a
+# bake.BakedLoop. Its update(now) method is called on every app update
+# while playing, rather than once per program step, and its
+# next_frame_ms(now) says how long until it will next change the LEDs,
+# so that garbage collection can be fitted in between frames.
+animation: "Optional[Any]" = None
+
+
+def set_leds(leds, rgb):
+  """Set each LED numbered in leds (0-based) to the colour rgb,
+  without writing to the hardware."""
+  for n in leds:
+    frame[n*3] = rgb[0]
+    frame[n*3+1] = rgb[1]
+    frame[n*3+2] = rgb[2]
+
+
+def set_frame(data):
+  """Replace the whole frame, for example from a checkpoint."""
+  frame[:] = bytes(data)
+
+
+def _buffer_positions():
+  # Where each byte of the frame goes in the NeoPixel driver's own
+  # buffer, if it has one (MicroPython's neopixel does). The badge's
+  # LED 0 isn't part of the ring, so frame LED n is hardware LED n+1.
+  pixels = tildagonos.leds
+  if not (hasattr(pixels, "buf") and hasattr(pixels, "ORDER") and hasattr(pixels, "bpp")):
+    return None
+  positions = bytearray(NUM_LEDS * 3)
+  for n in range(0, NUM_LEDS):
+    for c in range(0, 3):
+      positions[n*3+c] = (n+1) * pixels.bpp + pixels.ORDER[c]
+  return positions
+
+
+_positions = _buffer_positions()
+
+
+def show():
+  """Write the frame out to the hardware LEDs."""
+  if _positions is not None:
+    # copy straight into the driver's buffer: setting pixels through
+    # the driver needs a tuple per LED, which allocates on every frame.
+    # (getattr, as the simulator's stand-in LEDs don't have a buffer)
+    buf = getattr(tildagonos.leds, "buf")
+    for i in range(0, NUM_LEDS * 3):
+      buf[_positions[i]] = frame[i]
+  else:
+    for n in range(0, NUM_LEDS):
+      tildagonos.leds[n+1] = (frame[n*3], frame[n*3+1], frame[n*3+2])
+  tildagonos.leds.write()
+  if recorder is not None:
+    recorder.record(frame, time.ticks_ms())
@@ -0,0 +1,108 @@
+# A library of saved programs on the badge filesystem.
+#
+# Each program is stored in its own file, and a small index file holds
+# what is needed to list and choose programs: names, file names, sizes,
+# step counts, which triggers they use, and a checksum of each file. So
+# listing programs only ever reads the index, however many programs
+# there are, and switching program only reads the chosen program's file.
+
+import binascii
+import json
+import os
+
+from .const import SAVE_DIR
+from .files import ensure_save_dir, replace_file
+from .program import program_to_data
+
+LIBRARY_DIR = SAVE_DIR + "/programs"
+INDEX_FILE = LIBRARY_DIR + "/index.json"
+
+INDEX_VERSION = 1
+
+
+def _empty_index():
+  return {"version": INDEX_VERSION, "next": 1, "programs": []}
+
+
+def load_index():
+  try:
+    with open(INDEX_FILE) as f:
+      index = json.load(f)
+  except OSError:
+    return _empty_index()
+  except ValueError as e:
+    print(f"Ignoring unreadable program index: {e}")
+    return _empty_index()
+  if index.get("version") != INDEX_VERSION:
+    print(f"Ignoring program index with unsupported version {index.get('version')}")
+    return _empty_index()
+  return index
+
+
+def _write_json(path, data):
+  tmp_path = path + ".tmp"
+  with open(tmp_path, "w") as f:
+    f.write(data)
+  replace_file(tmp_path, path)
+
+
+def _save_index(index):
+  _write_json(INDEX_FILE, json.dumps(index))
+
+
+def find_entry(index, name):
+  for entry in index["programs"]:
+    if entry["name"] == name:
+      return entry
+  return None
+
+
+def save_program(sequence, name=None):
+  """Save a program into the library, replacing any program with the
+  same name. If name is None, a new name is made up. Returns the name."""
+  ensure_save_dir()
+  try:
+    os.mkdir(LIBRARY_DIR)
+  except OSError:
+    pass  # already exists
+
+  index = load_index()
+  if name is None:
+    name = f"Program {index['next']}"
+  entry = find_entry(index, name)
+  if entry is None:
+    entry = {"name": name, "file": f"p{index['next']}.json"}
+    index["next"] += 1
+    index["programs"].append(entry)
+
+  data = json.dumps({"name": name, "program": program_to_data(sequence)})
+  entry["size"] = len(data)
+  entry["steps"] = len(sequence)
+  entry["triggers"] = [step.type_name for step in sequence if step.type_name.startswith("when_")]
+  entry["crc"] = binascii.crc32(data.encode())
+
+  _write_json(LIBRARY_DIR + "/" + entry["file"], data)
+  _save_index(index)
+  return name
+
+
+def read_program(entry):
+  """Read the program data for an index entry. Raises ValueError if the
+  file doesn't match its checksum or isn't a program file, or OSError if
+  it can't be read."""
+  with open(LIBRARY_DIR + "/" + entry["file"], "rb") as f:
+    # check the checksum a chunk at a time, and then parse from the
+    # file, so that the whole file text is never held in memory.
+    crc = 0
+    while True:
+      chunk = f.read(256)
+      if not chunk:
+        break
+      crc = binascii.crc32(chunk, crc)
+    if crc != entry["crc"]:
+      raise ValueError(f"Program file for {entry['name']} is corrupt")
+    f.seek(0)
+    data = json.load(f)
+  if not isinstance(data, dict) or "program" not in data:
+    raise ValueError(f"Program file for {entry['name']} has no program")
+  return data["program"]
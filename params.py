@@ -0,0 +1,45 @@
+# Shared step parameters.
+#
+# Programs repeat the same few steps many times over: the same colours,
+# the same pauses. Heap per step is what limits how long a program can be
+# on the badge, so steps keep their parameters (and anything worked out
+# from them, such as colours for drawing and fade tables) in a separate
+# record, and identical steps share one record from the table here,
+# rather than each having their own copies. A step's own attributes are
+# then only its record and whatever changes as it runs.
+#
+# Records must never be changed once made, because other steps may be
+# using them. A step with different parameters gets a different record.
+
+_table: dict = {}
+
+
+def shared(record_class, *args):
+  """Return the shared record_class(*args), making it the first time
+  it is asked for."""
+  key = (record_class, args)
+  record = _table.get(key)
+  if record is None:
+    record = record_class(*args)
+    _table[key] = record
+  return record
+
+
+def clear():
+  """Forget all the records, for example because the program they were
+  shared by has been replaced. Steps still using them keep them."""
+  _table.clear()
+
+
+def prune(steps):
+  """Forget the records that none of steps use, such as those of
+  steps that have been deleted, so that they can be freed. Steps that
+  aren't in steps (such as those kept for undo) keep their records, but
+  new steps won't share them."""
+  used = set()
+  for step in steps:
+    record = getattr(step, "record", None)
+    if record is not None:
+      used.add(id(record))
+  for key in [key for (key, record) in _table.items() if id(record) not in used]:
+    del _table[key]
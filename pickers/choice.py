@@ -0,0 +1,39 @@
+from .menu import open_menu
+from ..const import EDIT_MODE
+
+
+class ChoicesUI:
+  """Ask the user to pick from a series of menus, one after another,
+  and then call callback with the list of items chosen from each."""
+
+  def __init__(self, app, choices, callback):
+    self.app = app
+    self._choices = choices
+    self._callback = callback
+    self._chosen: list[str] = []
+    self.ui_delegate = self._make_menu()
+
+  def _make_menu(self):
+    # only one set of choices is ever being made at once, so they can
+    # all share one menu.
+    return open_menu(self.app, "choices", self._choices[len(self._chosen)], self._handle_menu_select, self._handle_menu_back)
+
+  def update(self, delta):
+    self.ui_delegate.update(delta)
+
+  def draw(self, ctx):
+    self.ui_delegate.draw(ctx)
+
+  def _handle_menu_select(self, item, idx):
+    self.ui_delegate._cleanup()
+    self._chosen.append(item)
+    if len(self._chosen) < len(self._choices):
+      self.ui_delegate = self._make_menu()
+    else:
+      self._callback(self._chosen)
+
+  def _handle_menu_back(self):
+    # like the pause picker, this goes all the way back to edit mode.
+    self.ui_delegate._cleanup()
+    self.app.ui_delegate = None
+    self.app._mode = EDIT_MODE
@@ -1,53 +1,164 @@
 import math
+import time
 
-from tildagonos import tildagonos
 from system.eventbus import eventbus
-from events.input import BUTTON_TYPES, ButtonDownEvent
+from events.input import BUTTON_TYPES, ButtonDownEvent, ButtonUpEvent
+
+from .. import leds
+from ..gamma import GAMMA, DEGAMMA
+
+# The palette is a wheel of fully saturated hues, then white, then off.
+# Each of those can be shown at BRIGHTNESS_LEVELS brightnesses, evenly
+# spaced to the eye. All the colours are worked out once, at import, into
+# PALETTE, 3 bytes (r, g, b) per colour, at (entry * BRIGHTNESS_LEVELS +
+# level) * 3.
+HUE_STEPS = 48
+WHITE = HUE_STEPS
+OFF = HUE_STEPS + 1
+PALETTE_ENTRIES = HUE_STEPS + 2
+BRIGHTNESS_LEVELS = 8
+
+# Holding UP or DOWN repeats, after REPEAT_DELAY_MS, every REPEAT_MS,
+# moving further round the wheel each time the longer it is held.
+REPEAT_DELAY_MS = 400
+REPEAT_MS = 100
+ACCELERATE_EVERY_MS = 1000
+MAX_REPEAT_STEP = 4
+
+
+def _hue(h):
+  # full brightness colour at hue h of HUE_STEPS, red first
+  pos = h * 1536 // HUE_STEPS
+  rise = pos & 255
+  fall = 255 - rise
+  sector = pos >> 8
+  if sector == 0:
+    return (255, rise, 0)
+  elif sector == 1:
+    return (fall, 255, 0)
+  elif sector == 2:
+    return (0, 255, rise)
+  elif sector == 3:
+    return (0, fall, 255)
+  elif sector == 4:
+    return (rise, 0, 255)
+  else:
+    return (255, 0, fall)
+
+
+def _make_palette():
+  palette = bytearray(PALETTE_ENTRIES * BRIGHTNESS_LEVELS * 3)
+  for entry in range(0, PALETTE_ENTRIES):
+    if entry == WHITE:
+      rgb = (255, 255, 255)
+    elif entry == OFF:
+      rgb = (0, 0, 0)
+    else:
+      rgb = _hue(entry)
+    for level in range(0, BRIGHTNESS_LEVELS):
+      i = (entry * BRIGHTNESS_LEVELS + level) * 3
+      for c in range(0, 3):
+        palette[i+c] = GAMMA[DEGAMMA[rgb[c]] * (level + 1) // BRIGHTNESS_LEVELS]
+  return palette
+
+
+PALETTE = _make_palette()
+
 
 class ColourPicker:
 
   def __init__(self, app, callback):
     self.app = app
-    self.chosen_colour = 0
+    # start on full brightness red
+    self.entry = 0
+    self.level = BRIGHTNESS_LEVELS - 1
     self.rgb = (0,0,0)
+    self.open(callback)
+
+  def open(self, callback):
+    """Start choosing a colour, from the one chosen last time."""
     self._callback = callback
+    # index into PALETTE of what the LEDs and screen are showing, or -1
+    # to show the selection on the next update.
+    self._shown = -1
+    # button being held for repeating (1 for UP, -1 for DOWN, or 0),
+    # when it was pressed and when it next repeats.
+    self._held = 0
+    self._held_since = 0
+    self._next_repeat = 0
     eventbus.on(ButtonDownEvent, self._handle_buttondown, self.app)
+    eventbus.on(ButtonUpEvent, self._handle_buttonup, self.app)
+
+  def _selected(self):
+    return (self.entry * BRIGHTNESS_LEVELS + self.level) * 3
+
+  def _move(self, steps):
+    self.entry = (self.entry + steps) % PALETTE_ENTRIES
 
   def update(self, delta):
-    if self.chosen_colour == 0:
-      self.rgb = (255,0,0)
-    elif self.chosen_colour == 1:
-      self.rgb = (0,255,0)
-    elif self.chosen_colour == 2:
-      self.rgb = (0,0,255)
-    elif self.chosen_colour == 3:
-      self.rgb = (0,0,0)
-    else:
-      self.rgb = (0,0,0)
+    if self._held != 0:
+      now = time.ticks_ms()
+      if time.ticks_diff(now, self._next_repeat) >= 0:
+        held_ms = time.ticks_diff(now, self._held_since)
+        self._move(self._held * min(1 + held_ms // ACCELERATE_EVERY_MS, MAX_REPEAT_STEP))
+        self._next_repeat = time.ticks_add(now, REPEAT_MS)
 
-    for n in range(0,12):
-      tildagonos.leds[n+1] = self.rgb
-    tildagonos.leds.write()
+    # only write to the LEDs when the selection has changed
+    i = self._selected()
+    if i == self._shown:
+      return
+    self._shown = i
+    self.rgb = (PALETTE[i], PALETTE[i+1], PALETTE[i+2])
+    self._draw_colour = (PALETTE[i] / 255, PALETTE[i+1] / 255, PALETTE[i+2] / 255)
+    leds.set_leds(leds.ALL_LEDS, self.rgb)
+    leds.show()
 
   def draw(self, ctx):
+    if self._shown < 0:
+      return
 
     ctx.arc(0, 0, 60, 0, 2 * math.pi, True)
-    ctx.rgb(*self.rgb).fill()
+    ctx.rgb(*self._draw_colour).fill()
 
   def _cleanup(self):
+    self._held = 0
     eventbus.remove(ButtonDownEvent, self._handle_buttondown, self.app)
+    eventbus.remove(ButtonUpEvent, self._handle_buttonup, self.app)
 
   def _handle_buttondown(self, event):
-    if BUTTON_TYPES["UP"] in event.button:
-      self.chosen_colour = (self.chosen_colour + 1) % 4
-    elif BUTTON_TYPES["DOWN"] in event.button:
-      self.chosen_colour = (self.chosen_colour + 1) % 4
+    if BUTTON_TYPES["UP"] in event.button or BUTTON_TYPES["DOWN"] in event.button:
+      self._held = 1 if BUTTON_TYPES["UP"] in event.button else -1
+      self._move(self._held)
+      now = time.ticks_ms()
+      self._held_since = now
+      self._next_repeat = time.ticks_add(now, REPEAT_DELAY_MS)
+    elif BUTTON_TYPES["RIGHT"] in event.button:
+      self.level = min(self.level + 1, BRIGHTNESS_LEVELS - 1)
+    elif BUTTON_TYPES["LEFT"] in event.button:
+      self.level = max(self.level - 1, 0)
     elif BUTTON_TYPES["CONFIRM"] in event.button:
-      eventbus.remove(ButtonDownEvent, self._handle_buttondown, self.app)
-      self._callback(self.rgb)
+      self._cleanup()
+      i = self._selected()
+      self._callback((PALETTE[i], PALETTE[i+1], PALETTE[i+2]))
 
       assert self.app.sequence_pos >= 0
       assert self.app.sequence_pos < len(self.app.sequence)
     else:
       print("unhandled button event in ColourPicker - ignoring")
 
+  def _handle_buttonup(self, event):
+    if (self._held == 1 and BUTTON_TYPES["UP"] in event.button) or (self._held == -1 and BUTTON_TYPES["DOWN"] in event.button):
+      self._held = 0
+
+
+def open_colour_picker(app, callback):
+  """Return the app's ColourPicker, ready to choose a colour for
+  callback. Like menus (see pickers.menu) it is made on first use, kept
+  in app.ui_pool and reused after that."""
+  picker = app.ui_pool.get("colour")
+  if picker is None:
+    picker = ColourPicker(app, callback)
+    app.ui_pool["colour"] = picker
+  else:
+    picker.open(callback)
+  return picker
@@ -0,0 +1,24 @@
+from app_components import Menu
+from system.eventbus import eventbus
+from events.input import ButtonDownEvent
+
+
+def open_menu(app, name, menu_items, select_handler, back_handler):
+  """Return a Menu showing menu_items, starting at the top.
+
+  Menus are made once per name, on first use, and kept in app.ui_pool.
+  After that the same Menu is reset and its button handler attached
+  again, rather than a new one being built every time it is opened. As
+  with a new Menu, it should be closed with _cleanup, which detaches
+  the handler."""
+  menu = app.ui_pool.get(name)
+  if menu is None:
+    menu = Menu(app, menu_items, select_handler=select_handler, back_handler=back_handler)
+    app.ui_pool[name] = menu
+  else:
+    menu.menu_items = menu_items
+    menu.position = 0
+    menu.select_handler = select_handler
+    menu.back_handler = back_handler
+    eventbus.on(ButtonDownEvent, menu._handle_buttondown, app)
+  return menu
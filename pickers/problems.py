@@ -0,0 +1,50 @@
+from system.eventbus import eventbus
+from events.input import ButtonDownEvent
+
+from ..const import EDIT_MODE
+
+# at most this many problems fit on the screen
+MAX_SHOWN = 5
+
+LINE_HEIGHT = 22
+
+
+class ProblemsUI:
+  """Show why a program can't be played (a list of verify.Problems),
+  or why something else couldn't be done, under heading. Any button
+  goes back to edit mode, at the first problem's step."""
+
+  def __init__(self, app, problems, heading="Can't play:"):
+    self.app = app
+    self.problems = problems
+    self.heading = heading
+    eventbus.on(ButtonDownEvent, self._handle_buttondown, self.app)
+
+  def update(self, delta):
+    pass
+
+  def draw(self, ctx):
+    ctx.text_baseline = ctx.MIDDLE
+    ctx.font_size = 18
+    lines = [self.heading] + [str(p) for p in self.problems[0:MAX_SHOWN]]
+    if len(self.problems) > MAX_SHOWN:
+      lines.append(f"and {len(self.problems) - MAX_SHOWN} more")
+    y = -(len(lines) - 1) * LINE_HEIGHT / 2
+    colour = (255, 0, 0)
+    for text in lines:
+      tw = ctx.text_width(text)
+      ctx.move_to(int(-tw/2), y).rgb(*colour).text(text)
+      colour = (255, 255, 255)
+      y += LINE_HEIGHT
+
+  def _cleanup(self):
+    eventbus.remove(ButtonDownEvent, self._handle_buttondown, self.app)
+
+  def _handle_buttondown(self, event):
+    self._cleanup()
+    for p in self.problems:
+      if p.step_number is not None and p.step_number < len(self.app.sequence):
+        self.app.sequence_pos = p.step_number
+        break
+    self.app.ui_delegate = None
+    self.app._mode = EDIT_MODE
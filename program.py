@@ -0,0 +1,161 @@
+# Saving and loading programs as plain data.
+#
+# A program is saved as a list of steps, each of which is a list of the
+# step's type_name followed by its params(). This is what checkpoints
+# (and anything else that stores programs) use.
+
+from .registry import step_class_for
+from .steps.base import BlockStep, EndStep, Step, WhenStep
+
+# The program used when there is nothing saved.
+DEFAULT_PROGRAM = [
+  ["when_button"],
+    ["led", 255, 255, 255],
+    ["pause", 500],
+    ["led", 0, 0, 255],
+    ["pause", 500],
+  ["end"],
+
+  ["when_play"],
+    ["forever"],
+      ["led", 255, 0, 0],
+      ["pause", 500],
+      ["led", 0, 0, 0],
+      ["pause", 500],
+    ["end"],
+  ["end"],
+
+  ["when_upright"],
+    ["led", 0, 255, 0],
+  ["end"],
+]
+
+
+def program_to_data(sequence):
+  return [[step.type_name] + step.params() for step in sequence]
+
+
+def program_from_data(app, data):
+  """Build a list of steps from saved data. Raises KeyError for unknown
+  step types."""
+  return [step_class_for(d[0]).from_params(app, d[1:]) for d in data]
+
+
+def link_steps(sequence):
+  """Reset every step, number it, and link blocks to their end steps.
+  Raises AssertionError if the program isn't well formed."""
+  end_stack: list[BlockStep] = []
+  n = 0
+  for step in sequence:
+    step.reset()
+
+    step._step_number = n
+
+    if isinstance(step, WhenStep):
+      assert end_stack == [], f"When-steps can only occur at the top level: {end_stack}"
+    else:
+      assert end_stack != [], f"Top level steps but be When-steps: {end_stack}"
+ 
+    if isinstance(step, BlockStep):
+      print(f"Appending to block stack for step {n}, {step}")
+      print(f"Stack: {end_stack}")
+      end_stack.append(step)
+
+    # the When block that this step is part of, which its running is
+    # charged to (see WhenStep.charge)
+    step._when = end_stack[0]
+
+    if isinstance(step, EndStep):
+      print(f"Popping from block stack for step {n}, {step}")
+      step._start_step = end_stack.pop()
+      step._start_step._end_step = n
+      print(f"Stack: {end_stack}")
+
+    n += 1
+
+  # TODO: the UI needs to enforce this too, because otherwise users will
+  # easily violate this.
+  assert end_stack == [], f"end stack is not empty after step reset: {end_stack}"
+
+
+def resolve_calls(sequence):
+  """Point each Call routine step at the Define routine step for its
+  routine (the first, if there are several), or None if there isn't
+  one, and work out which routines can wait. Run after link_steps."""
+  routines: dict = {}
+  for step in sequence:
+    if step.type_name == "define_routine" and step.number not in routines:
+      routines[step.number] = step
+  for step in sequence:
+    if step.type_name == "call_routine":
+      step._target = routines.get(step.number)
+
+  # A routine can wait if anything in it can, including the routines
+  # it calls. Routines can call each other in any order, so repeat
+  # until nothing changes.
+  for routine in routines.values():
+    routine._takes_time = False
+  changed = True
+  while changed:
+    changed = False
+    for routine in routines.values():
+      if not routine._takes_time and loop_takes_time(sequence, routine._step_number, routine._end_step):
+        routine._takes_time = True
+        changed = True
+
+
+def loop_takes_time(sequence, start, end):
+  """True if anything in the body of the loop from start to end (the
+  positions of its first and end steps) can wait. If nothing can, the
+  loop is a busy loop: it will spin without ever pausing."""
+  for step in sequence[start+1:end]:
+    if step.takes_time():
+      return True
+  return False
+
+
+# Rough sizes of MicroPython heap objects on the badge (a 32 bit port),
+# for estimating how much memory a program uses.
+_OBJECT_BYTES = 16
+_WORD_BYTES = 4
+_DICT_ENTRY_BYTES = 2 * _WORD_BYTES
+
+
+def _estimate_bytes(value, seen):
+  # small ints, bools and None aren't heap allocated
+  if value is None or isinstance(value, (bool, int)):
+    return 0
+  # anything referenced more than once only takes space once
+  if id(value) in seen:
+    return 0
+  seen.add(id(value))
+  if isinstance(value, (str, bytes, bytearray)):
+    return _OBJECT_BYTES + len(value)
+  if isinstance(value, (tuple, list)):
+    return _OBJECT_BYTES + _WORD_BYTES * len(value) + sum([_estimate_bytes(v, seen) for v in value])
+  if isinstance(value, dict):
+    return _OBJECT_BYTES + _DICT_ENTRY_BYTES * len(value) + sum([_estimate_bytes(v, seen) for v in value.values()])
+  if hasattr(value, "__dict__"):
+    attrs = value.__dict__
+    total = 2 * _OBJECT_BYTES + _DICT_ENTRY_BYTES * len(attrs)
+    for (name, v) in attrs.items():
+      # other steps are counted as part of the program, and the app
+      # isn't part of a step.
+      if name != "app" and not isinstance(v, Step):
+        total += _estimate_bytes(v, seen)
+    return total
+  return _OBJECT_BYTES
+
+
+def estimate_memory(sequence, shared=True):
+  """Estimate the heap bytes used by the steps of a program, including
+  the list that holds them. With shared=False, estimate as if no steps
+  shared anything (such as their parameter records, see params), to see
+  how much sharing saves."""
+  seen: set = set()
+  total = _OBJECT_BYTES + _WORD_BYTES * len(sequence)
+  for step in sequence:
+    if not shared:
+      seen = set()
+    total += _estimate_bytes(step, seen)
+  return total
@@ -0,0 +1,148 @@
+# Registry of step types.
+#
+# Each step type is registered with its metadata (its label in the
+# insert step menu, and the category the menu groups it under) and a
+# loader for the module that implements it. Step modules are only
+# imported when a program actually uses that step type, or when the
+# user opens its insert UI, so that app startup doesn't pay for
+# importing every step module (and their dependencies, such as the IMU
+# driver or the colour picker).
+#
+# To add a new step type, add a loader and a StepType entry below.
+
+from .steps.base import EndStep
+
+# Step categories, in the order the insert step menu shows them.
+CATEGORIES = ["action", "control", "routine", "trigger"]
+
+
+class StepType:
+  def __init__(self, type_name, label, category, loader, class_name, insert_ui_name, param_kinds=""):
+    # type_name matches the step class's type_name attribute, and is
+    # used in saved programs.
+    self.type_name = type_name
+    # label is shown in the insert step menu
+    self.label = label
+    # category is one of CATEGORIES
+    self.category = category
+    # param_kinds describes the params saved for this type of step, a
+    # letter each: "i" for an int, "v" for a variable number and "e" for
+    # an expression's source. Any after a "/" are optional. See
+    # verify.check_data.
+    self.param_kinds = param_kinds
+    self._loader = loader
+    self._class_name = class_name
+    self._insert_ui_name = insert_ui_name
+
+  def step_class(self):
+    return getattr(self._loader(), self._class_name)
+
+  def make_insert_ui(self, app):
+    return getattr(self._loader(), self._insert_ui_name)(app)
+
+
+# Loaders. These import inside the function so that nothing is imported
+# until the step type is first used.
+
+def _load_button():
+  from .steps import button
+  return button
+
+def _load_count():
+  from .steps import count
+  return count
+
+def _load_fade():
+  from .steps import fade
+  return fade
+
+def _load_forever():
+  from .steps import forever
+  return forever
+
+def _load_imu():
+  from .steps import imu
+  return imu
+
+def _load_led():
+  from .steps import led
+  return led
+
+def _load_pause():
+  from .steps import pause
+  return pause
+
+def _load_variables():
+  from .steps import variables
+  return variables
+
+def _load_ifvar():
+  from .steps import ifvar
+  return ifvar
+
+def _load_repeat():
+  from .steps import repeat
+  return repeat
+
+def _load_routine():
+  from .steps import routine
+  return routine
+
+def _load_timer():
+  from .steps import timer
+  return timer
+
+def _load_whenplay():
+  from .steps import whenplay
+  return whenplay
+
+
+# In insert step menu order, within each category.
+STEP_TYPES = [
+  StepType("led", "Set LEDs", "action", _load_led, "LEDStep", "InsertLEDStepUI", "iii"),
+  StepType("fade", "Fade LEDs", "action", _load_fade, "FadeStep", "InsertFadeStepUI", "iiii"),
+  StepType("gradient", "Rotating gradient", "action", _load_fade, "GradientStep", "InsertGradientStepUI", "iiiiiiii"),
+  StepType("pause", "Pause", "action", _load_pause, "PauseStep", "InsertPauseStepUI", "i/i"),
+  StepType("count", "Count loops", "action", _load_count, "CountLoopsStep", "InsertCountLoopsUI"),
+  StepType("when_button", "When button pushed", "trigger", _load_button, "WhenButtonPushedStep", "InsertWhenButtonPushedUI"),
+  StepType("when_upright", "When badge goes upright", "trigger", _load_imu, "WhenIMUUpright", "InsertIMUUpright"),
+  StepType("when_play", "When play starts", "trigger", _load_whenplay, "WhenPlayStep", "InsertWhenPlayStepUI"),
+  StepType("when_every", "Every N ms", "trigger", _load_timer, "WhenEveryStep", "InsertWhenEveryUI", "i"),
+  StepType("when_after", "After N ms of play", "trigger", _load_timer, "WhenAfterStep", "InsertWhenAfterUI", "i"),
+  StepType("define_routine", "Define routine", "routine", _load_routine, "DefineRoutineStep", "InsertDefineRoutineUI", "i"),
+  StepType("call_routine", "Call routine", "routine", _load_routine, "CallRoutineStep", "InsertCallRoutineUI", "i"),
+  StepType("forever", "Repeat forever", "control", _load_forever, "RepeatForeverStep", "InsertRepeatForeverStepUI"),
+  StepType("repeat", "Repeat N times", "control", _load_repeat, "RepeatTimesStep", "InsertRepeatTimesStepUI", "e"),
+  StepType("if", "If variable", "control", _load_ifvar, "IfStep", "InsertIfStepUI", "e"),
+  StepType("set_var", "Set variable", "action", _load_variables, "SetVariableStep", "InsertSetVariableUI", "ve"),
+  StepType("add_var", "Change variable", "action", _load_variables, "ChangeVariableStep", "InsertChangeVariableUI", "ve"),
+]
+
+_BY_NAME = {t.type_name: t for t in STEP_TYPES}
+_BY_LABEL = {t.label: t for t in STEP_TYPES}
+
+
+def menu_labels():
+  """The insert step menu's labels, grouped by category."""
+  return [t.label for c in CATEGORIES for t in STEP_TYPES if t.category == c]
+
+
+def step_type_for_label(label):
+  return _BY_LABEL[label]
+
+
+def param_kinds_for(type_name):
+  """Return the param_kinds for a saved type name, without importing
+  its module. Raises KeyError for unknown step types."""
+  if type_name == EndStep.type_name:
+    return ""
+  return _BY_NAME[type_name].param_kinds
+
+
+def step_class_for(type_name):
+  """Return the step class for a saved type name, importing its module
+  if needed. Raises KeyError for unknown step types."""
+  if type_name == EndStep.type_name:
+    # end steps aren't insertable on their own, so aren't in the menu
+    return EndStep
+  return _BY_NAME[type_name].step_class()
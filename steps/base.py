@@ -2,11 +2,23 @@ from ..const import LIVE_SIZE
 
 
 class Step:
+  # Name used for this kind of step in saved programs and checkpoints.
+  type_name = "step"
+
+  # Text drawn by render, cached because the display is redrawn on every
+  # frame while playing and building strings allocates. See _text_changed.
+  _text = ""
+  _text_step = None
+  _text_value = None
+
   def __init__(self):
     # Where the step lives inside the program, for referencing.
     # I'd prefer a more object graph style program structure,
     # which would get rid of this field.
     self._step_number: int
+    # The When block that this step is part of, which its running is
+    # charged to. Set by program.link_steps.
+    self._when: WhenStep
 
   def enter_step(self):
     pass
@@ -19,10 +31,28 @@ class Step:
     return True
 
   def render(self, mode, ctx, render_step, y, text_colour):
-    text = f"{render_step}: No description"
+    if self._text_changed(render_step):
+      self._text = f"{render_step}: No description"
+    text = self._text
     tw = ctx.text_width(text)
     ctx.move_to(int(-tw/2), y).rgb(*text_colour).text(text)
 
+  def _text_changed(self, render_step, value=None):
+    # True if self._text needs rebuilding, because the step is being
+    # rendered at a different position, or value (anything else that
+    # the text shows and that can change) is different.
+    if render_step == self._text_step and value == self._text_value:
+      return False
+    self._text_step = render_step
+    self._text_value = value
+    return True
+
+  def takes_time(self):
+    # True if this step can wait (return False from progress_step)
+    # rather than always finishing straight away, so that a loop
+    # containing it doesn't spin without a break.
+    return False
+
   def poll_for_when(self):
     # If this is a When step that has fired (and so wants to run events),
     # return True (once) and the executor will start running at the
@@ -33,6 +63,32 @@ class Step:
     # Called to reset the step, for example when play stops or starts
     pass
 
+  def release(self):
+    # Called when the step is no longer part of any program, for
+    # example when switching to a different program, so that it can
+    # let go of anything (such as event handlers) keeping it alive.
+    pass
+
+  def params(self):
+    # The parameters needed to recreate this step with from_params,
+    # for saving programs.
+    return []
+
+  @classmethod
+  def from_params(cls, app, params):
+    return cls(*params)
+
+  def save_state(self, now):
+    # Runtime state to save in a checkpoint, or None if there is none.
+    # Anything time based should be saved relative to now, because
+    # ticks_ms values are meaningless after a reboot.
+    return None
+
+  def restore_state(self, state, now):
+    # Restore state returned by save_state, with times relative to
+    # the new now.
+    pass
+
 
 # kind of step that pairs with an EndStep to scope out a block of steps
 class BlockStep(Step):
@@ -48,20 +104,33 @@ class BlockStep(Step):
         """Return the name used in end blocks"""
         return "block"
 
+    def analyse_body(self, sequence):
+        """Called when the program has been linked, for blocks that
+        precompute things about the steps in their body."""
+        pass
+
 
 class EndStep(Step):
+  type_name = "end"
+
   def __init__(self):
     self._start_step = None
     # this should be set dynamically at start of execution to the
     # executor-detected start step.
 
   def progress_step(self):
-    assert isinstance(self._start_step, BlockStep), f"start step should be a BlockStep: {self._start_step}"
-    return self._start_step.progress_end_step()
+    # verify.verify checks that this is linked to a BlockStep before
+    # play starts, so this is only None in an unplayable program.
+    start = self._start_step
+    if start is None:
+      return True
+    return start.progress_end_step()
 
   def render(self, mode, ctx, render_step, y, text_colour):
     if self._start_step:
-        text = "End " + self._start_step.get_end_name()
+        if self._text_changed(render_step, self._start_step):
+            self._text = "End " + self._start_step.get_end_name()
+        text = self._text
     else:
         text = "End ... of something?"
         print("consistency error: end step with missing start step")
@@ -84,10 +153,34 @@ class EndStep(Step):
         ctx.stroke()
 
 
+# CPU quotas for When blocks. In each window of QUOTA_WINDOW_MS, a When
+# block (including its firing) can run up to QUOTA_STEPS steps, taking up
+# to QUOTA_US of time running them. A block that goes over is throttled
+# for the rest of the window: it doesn't run or fire, so that a busy or
+# runaway block can't starve the rest of the program or the badge.
+QUOTA_WINDOW_MS = 1000
+QUOTA_STEPS = 500
+QUOTA_US = 200000
+
+# How many times a When block can be interrupted by itself firing again
+# before it has finished. The stack is allocated up front, so that
+# firing doesn't allocate while playing.
+MAX_INTERRUPT_DEPTH = 8
+
+
 class WhenStep(BlockStep):
 
     def __init__(self):
-        self.interrupt_stack: list[int] = []
+        # positions to return to, in interrupt_stack[0:interrupt_depth]
+        self.interrupt_stack: list[int] = [0] * MAX_INTERRUPT_DEPTH
+        self.interrupt_depth = 0
+
+        # quota use in the current window, and how many windows this
+        # block has been throttled in since play started.
+        self.steps_used = 0
+        self.us_used = 0
+        self.throttled = False
+        self.times_throttled = 0
 
     """Top-level When steps."""
     def get_end_name(self):
@@ -95,10 +188,46 @@ class WhenStep(BlockStep):
 
     def enter_when(self, prev_pos):
         """Stack up the previous pos for returning to when this block is over."""
-        self.interrupt_stack.append(prev_pos)
+        if self.interrupt_depth == MAX_INTERRUPT_DEPTH:
+            # Keep the oldest positions, so that the program still gets
+            # back to where it was before all this, and lose the most
+            # recent, which was inside this block anyway.
+            print("When block interrupted itself too many times - dropping a return position")
+            self.interrupt_depth -= 1
+        self.interrupt_stack[self.interrupt_depth] = prev_pos
+        self.interrupt_depth += 1
+
+    def reset(self):
+        self.interrupt_depth = 0
+        self.new_quota_window()
+        self.times_throttled = 0
+
+    def new_quota_window(self):
+        self.steps_used = 0
+        self.us_used = 0
+        self.throttled = False
+
+    def charge(self, steps, us):
+        """Count steps run by this block, taking us microseconds, against
+        its quota. Throttles the block if that puts it over."""
+        self.steps_used += steps
+        self.us_used += us
+        if not self.throttled and (self.steps_used > QUOTA_STEPS or self.us_used > QUOTA_US):
+            print(f"When block at step {self._step_number} is over its quota - throttling it")
+            self.throttled = True
+            self.times_throttled += 1
 
     def progress_end_step(self):
-        if len(self.interrupt_stack) > 0:
-            return self.interrupt_stack.pop()
+        if self.interrupt_depth > 0:
+            self.interrupt_depth -= 1
+            return self.interrupt_stack[self.interrupt_depth]
         else:
             return False
+
+    def save_state(self, now):
+        return [self.interrupt_stack[0:self.interrupt_depth]]
+
+    def restore_state(self, state, now):
+        stack = state[0][0:MAX_INTERRUPT_DEPTH]
+        self.interrupt_stack[0:len(stack)] = stack
+        self.interrupt_depth = len(stack)
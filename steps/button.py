@@ -6,6 +6,7 @@ from ..const import LIVE_SIZE, PLAY_MODE, EDIT_MODE
 
 
 class WhenButtonPushedStep(WhenStep):
+  type_name = "when_button"
 
   def __init__(self, app):
     super().__init__()
@@ -19,6 +20,13 @@ class WhenButtonPushedStep(WhenStep):
     if self.app._mode == PLAY_MODE and BUTTON_TYPES["CANCEL"] not in event.button:
       self.pressed = True
 
+  def release(self):
+    eventbus.remove(ButtonDownEvent, self._handle_buttondown, self.app)
+
+  @classmethod
+  def from_params(cls, app, params):
+    return cls(app)
+
   def poll_for_when(self):
     if self.pressed:
       self.pressed = False
@@ -49,8 +57,7 @@ class InsertWhenButtonPushedUI:
 
   def update(self, delta):
     """This is a WhenStep so the insert should happen at the end of the program, as a new top level block."""
-    self.app.sequence.append(WhenButtonPushedStep(self.app))
-    self.app.sequence.append(EndStep())
+    self.app.insert_steps(len(self.app.sequence), [WhenButtonPushedStep(self.app), EndStep()])
 
     # move cursor to end step so that a subsequent InsertStep will populate the new when block
     self.app.sequence_pos = len(self.app.sequence) - 1
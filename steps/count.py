@@ -2,6 +2,8 @@ from .base import Step
 from ..const import EDIT_MODE
 
 class CountLoopsStep(Step):
+  type_name = "count"
+
   def __init__(self):
     self.reset()
 
@@ -9,20 +11,28 @@ class CountLoopsStep(Step):
     self.count += 1
 
   def render(self, mode, ctx, render_step, y, text_colour):
-    text = f"{render_step}: Counted {self.count} times"
+    if self._text_changed(render_step, self.count):
+      self._text = f"{render_step}: Counted {self.count} times"
+    text = self._text
     tw = ctx.text_width(text)
     ctx.move_to(int(-tw/2), y).rgb(*text_colour).text(text)
 
   def reset(self):
     self.count = 0
 
+  def save_state(self, now):
+    return self.count
+
+  def restore_state(self, state, now):
+    self.count = state
+
 
 class InsertCountLoopsUI:
   def __init__(self, app):
     self.app = app
 
   def update(self, delta):
-    self.app.sequence.insert(self.app.sequence_pos, CountLoopsStep())
+    self.app.insert_steps(self.app.sequence_pos, [CountLoopsStep()])
     self.app.sequence_pos += 1
 
     assert self.app.sequence_pos >= 0
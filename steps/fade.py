@@ -0,0 +1,355 @@
+import time
+
+from .base import Step
+from .. import clock
+from .. import leds
+from .. import params
+from ..const import EDIT_MODE, ANIMATION_FRAME_MS
+from ..gamma import GAMMA, DEGAMMA
+from ..pickers.choice import ChoicesUI
+
+
+# Animated steps run as leds.animation, so they update the LEDs every
+# ANIMATION_FRAME_MS rather than once per program step. All their
+# buffers are allocated when the step is created, and each frame is
+# integer arithmetic and table lookups only. Tables that only depend on
+# the step's parameters are in its shared record (see params).
+
+
+class FadeParams:
+  """Where a FadeStep fades to, and how fast, shared between identical
+  steps."""
+
+  def __init__(self, r, g, b, ms):
+    self.rgb = (r, g, b)
+    self.ms = ms
+    # for drawing with
+    self.colour = (r / 256, g / 256, b / 256)
+    # perceived brightness of each LED's channels at the end of the fade
+    to = bytearray(leds.NUM_LEDS * 3)
+    for n in range(0, leds.NUM_LEDS):
+      to[n*3] = DEGAMMA[r]
+      to[n*3+1] = DEGAMMA[g]
+      to[n*3+2] = DEGAMMA[b]
+    self.to = bytes(to)
+
+
+class FadeStep(Step):
+  """Fade all LEDs from whatever they are showing to a colour."""
+  type_name = "fade"
+
+  def __init__(self, r, g, b, ms):
+    self.record = params.shared(FadeParams, r, g, b, ms)
+    # perceived brightness of each LED's channels at the start of the
+    # fade
+    self._from = bytearray(leds.NUM_LEDS * 3)
+    self.reset()
+
+  @property
+  def rgb(self):
+    return self.record.rgb
+
+  @property
+  def ms(self):
+    return self.record.ms
+
+  def reset(self):
+    self._start_ms = None
+    self._duration = self.record.ms
+    self._last_frame_ms = 0
+
+  def _start(self, now, duration):
+    frame = leds.frame
+    for i in range(0, leds.NUM_LEDS * 3):
+      self._from[i] = DEGAMMA[frame[i]]
+    self._start_ms = now
+    self._duration = duration
+    self._last_frame_ms = now
+    leds.animation = self
+
+  def enter_step(self):
+    self._start(time.ticks_ms(), self.record.ms)
+
+  def update(self, now):
+    if self._start_ms is None or time.ticks_diff(now, self._last_frame_ms) < ANIMATION_FRAME_MS:
+      return
+    self._last_frame_ms = now
+    elapsed = time.ticks_diff(now, self._start_ms)
+    if elapsed >= self._duration:
+      t = 256
+    else:
+      t = (elapsed << 8) // self._duration
+    frame = leds.frame
+    f = self._from
+    to = self.record.to
+    for i in range(0, leds.NUM_LEDS * 3):
+      pa = f[i]
+      frame[i] = GAMMA[pa + (((to[i] - pa) * t) >> 8)]
+    leds.show()
+
+  def next_frame_ms(self, now):
+    return ANIMATION_FRAME_MS - time.ticks_diff(now, self._last_frame_ms)
+
+  def progress_step(self):
+    if self._start_ms is None:
+      return False
+    now = time.ticks_ms()
+    end = time.ticks_add(self._start_ms, self._duration)
+    if time.ticks_diff(now, end) < 0:
+      clock.wake_at(end)
+      return False
+    # following pauses are timed from when the fade should have ended,
+    # like pauses after a pause.
+    clock.pause_finished(end, now)
+    # finish exactly on the target colour
+    leds.set_leds(leds.ALL_LEDS, self.record.rgb)
+    leds.show()
+    if leds.animation is self:
+      leds.animation = None
+    self._start_ms = None
+    return True
+
+  def takes_time(self):
+    return self.ms > 0
+
+  def position(self, now):
+    return (self._step_number, time.ticks_diff(now, self._start_ms))
+
+  def params(self):
+    return [self.rgb[0], self.rgb[1], self.rgb[2], self.ms]
+
+  def save_state(self, now):
+    if self._start_ms is None:
+      return None
+    return self._duration - time.ticks_diff(now, self._start_ms)
+
+  def restore_state(self, state, now):
+    # carry on fading from the (restored) frame for the time that was left
+    self._start(now, max(state, 0))
+
+  def render(self, mode, ctx, render_step, y, text_colour):
+    if self._text_changed(render_step):
+      self._text = f"{render_step}: Fade over {self.ms / 1000}s to "
+    text = self._text
+    tw = ctx.text_width(text)
+    tw2 = ctx.text_width("this colour")
+    w = tw + tw2
+    ctx.move_to(int(-w/2), y).rgb(*text_colour).text(text)
+    ctx.move_to(int(-w/2 + tw), y).rgb(*self.record.colour).text("this colour")
+
+
+# positions around the ring that a gradient is precomputed at, per LED.
+# Higher is smoother rotation, at the cost of a bigger table.
+GRADIENT_SUBSTEPS = 8
+_GRADIENT_POSITIONS = leds.NUM_LEDS * GRADIENT_SUBSTEPS
+
+
+class GradientParams:
+  """A GradientStep's colours and timing, and its precomputed ring of
+  colours, shared between identical steps."""
+
+  def __init__(self, r1, g1, b1, r2, g2, b2, period_ms, ms):
+    self.rgb1 = (r1, g1, b1)
+    self.rgb2 = (r2, g2, b2)
+    self.period_ms = period_ms
+    self.ms = ms
+    # for drawing with
+    self.colour1 = (r1 / 256, g1 / 256, b1 / 256)
+    self.colour2 = (r2 / 256, g2 / 256, b2 / 256)
+
+    # colour at each position around the ring
+    table = bytearray(_GRADIENT_POSITIONS * 3)
+    half = _GRADIENT_POSITIONS // 2
+    for p in range(0, _GRADIENT_POSITIONS):
+      # 0 at position 0, 256 half way round, and back to 0
+      if p < half:
+        t = (p << 8) // half
+      else:
+        t = ((_GRADIENT_POSITIONS - p) << 8) // half
+      for c in range(0, 3):
+        pa = DEGAMMA[self.rgb1[c]]
+        table[p*3+c] = GAMMA[pa + (((DEGAMMA[self.rgb2[c]] - pa) * t) >> 8)]
+    self.table = bytes(table)
+
+
+class GradientStep(Step):
+  """Show a gradient from one colour to another and back around the
+  ring, rotating once every period_ms, for ms (or forever if ms is 0)."""
+  type_name = "gradient"
+
+  def __init__(self, r1, g1, b1, r2, g2, b2, period_ms, ms):
+    self.record = params.shared(GradientParams, r1, g1, b1, r2, g2, b2, period_ms, ms)
+    self.reset()
+
+  def reset(self):
+    self._start_ms = None
+    self._last_frame_ms = 0
+    self._last_offset = -1
+
+  def enter_step(self):
+    now = time.ticks_ms()
+    self._start_ms = now
+    self._last_frame_ms = now
+    self._last_offset = -1
+    leds.animation = self
+    self.update(now)
+
+  def update(self, now):
+    if self._start_ms is None:
+      return
+    if self._last_offset >= 0 and time.ticks_diff(now, self._last_frame_ms) < ANIMATION_FRAME_MS:
+      return
+    self._last_frame_ms = now
+    elapsed = time.ticks_diff(now, self._start_ms)
+    period_ms = self.record.period_ms
+    offset = (elapsed % period_ms) * _GRADIENT_POSITIONS // period_ms
+    if offset == self._last_offset:
+      return
+    self._last_offset = offset
+    frame = leds.frame
+    table = self.record.table
+    for n in range(0, leds.NUM_LEDS):
+      j = ((n * GRADIENT_SUBSTEPS + offset) % _GRADIENT_POSITIONS) * 3
+      frame[n*3] = table[j]
+      frame[n*3+1] = table[j+1]
+      frame[n*3+2] = table[j+2]
+    leds.show()
+
+  def next_frame_ms(self, now):
+    return ANIMATION_FRAME_MS - time.ticks_diff(now, self._last_frame_ms)
+
+  def progress_step(self):
+    ms = self.record.ms
+    if ms == 0 or self._start_ms is None:
+      return False
+    now = time.ticks_ms()
+    end = time.ticks_add(self._start_ms, ms)
+    if time.ticks_diff(now, end) < 0:
+      clock.wake_at(end)
+      return False
+    clock.pause_finished(end, now)
+    if leds.animation is self:
+      leds.animation = None
+    self._start_ms = None
+    return True
+
+  def takes_time(self):
+    return True
+
+  def position(self, now):
+    return (self._step_number, time.ticks_diff(now, self._start_ms))
+
+  def params(self):
+    record = self.record
+    return list(record.rgb1) + list(record.rgb2) + [record.period_ms, record.ms]
+
+  def save_state(self, now):
+    if self._start_ms is None:
+      return None
+    return time.ticks_diff(now, self._start_ms)
+
+  def restore_state(self, state, now):
+    self.enter_step()
+    self._start_ms = time.ticks_add(now, -state)
+
+  def render(self, mode, ctx, render_step, y, text_colour):
+    if self._text_changed(render_step):
+      self._text = f"{render_step}: Gradient from "
+    text = self._text
+    tw = ctx.text_width(text)
+    tw2 = ctx.text_width("this ")
+    tw3 = ctx.text_width("to ")
+    w = tw + tw2 + tw3 + tw2
+    ctx.move_to(int(-w/2), y).rgb(*text_colour).text(text)
+    ctx.move_to(int(-w/2 + tw), y).rgb(*self.record.colour1).text("this ")
+    ctx.move_to(int(-w/2 + tw + tw2), y).rgb(*text_colour).text("to ")
+    ctx.move_to(int(-w/2 + tw + tw2 + tw3), y).rgb(*self.record.colour2).text("this")
+
+
+# menu labels and the times they mean, in menu order
+_FADE_DURATIONS = [("500ms", 500), ("1 second", 1000), ("2 seconds", 2000), ("5 seconds", 5000)]
+_GRADIENT_PERIODS = [("1 second", 1000), ("2 seconds", 2000), ("5 seconds", 5000)]
+_GRADIENT_DURATIONS = [("Forever", 0), ("5 seconds", 5000), ("30 seconds", 30000)]
+
+
+def _labels(options):
+  return [label for (label, _) in options]
+
+
+_FADE_DURATION_LABELS = _labels(_FADE_DURATIONS)
+_GRADIENT_PERIOD_LABELS = _labels(_GRADIENT_PERIODS)
+_GRADIENT_DURATION_LABELS = _labels(_GRADIENT_DURATIONS)
+
+
+def _value(options, chosen):
+  for (label, value) in options:
+    if label == chosen:
+      return value
+  assert False, f"invalid menu option {chosen}"
+
+
+class InsertFadeStepUI:
+  def __init__(self, app):
+    self.app = app
+    self.rgb = (0,0,0)
+    # imported here so the colour picker is only loaded when needed
+    from ..pickers.colour import open_colour_picker
+    self.ui_delegate = open_colour_picker(app, self.handle_colour_chosen)
+
+  def update(self, delta):
+    self.ui_delegate.update(delta)
+
+  def draw(self, ctx):
+    self.ui_delegate.draw(ctx)
+
+  def handle_colour_chosen(self, rgb):
+    self.ui_delegate._cleanup()
+    self.rgb = rgb
+    self.ui_delegate = ChoicesUI(self.app, [_FADE_DURATION_LABELS], self._handle_duration_chosen)
+
+  def _handle_duration_chosen(self, chosen):
+    step = FadeStep(self.rgb[0], self.rgb[1], self.rgb[2], _value(_FADE_DURATIONS, chosen[0]))
+    self.app.insert_steps(self.app.sequence_pos, [step])
+    self.app.sequence_pos += 1
+
+    assert self.app.sequence_pos >= 0
+    assert self.app.sequence_pos < len(self.app.sequence)
+
+    self.app._mode = EDIT_MODE
+    self.app.ui_delegate = None
+
+
+class InsertGradientStepUI:
+  def __init__(self, app):
+    self.app = app
+    self.colours: list = []
+    # imported here so the colour picker is only loaded when needed
+    from ..pickers.colour import open_colour_picker
+    self._open_picker = open_colour_picker
+    self.ui_delegate = open_colour_picker(app, self.handle_colour_chosen)
+
+  def update(self, delta):
+    self.ui_delegate.update(delta)
+
+  def draw(self, ctx):
+    self.ui_delegate.draw(ctx)
+
+  def handle_colour_chosen(self, rgb):
+    self.ui_delegate._cleanup()
+    self.colours.append(rgb)
+    if len(self.colours) < 2:
+      self.ui_delegate = self._open_picker(self.app, self.handle_colour_chosen)
+    else:
+      self.ui_delegate = ChoicesUI(self.app, [_GRADIENT_PERIOD_LABELS, _GRADIENT_DURATION_LABELS], self._handle_timing_chosen)
+
+  def _handle_timing_chosen(self, chosen):
+    (c1, c2) = self.colours
+    step = GradientStep(c1[0], c1[1], c1[2], c2[0], c2[1], c2[2], _value(_GRADIENT_PERIODS, chosen[0]), _value(_GRADIENT_DURATIONS, chosen[1]))
+    self.app.insert_steps(self.app.sequence_pos, [step])
+    self.app.sequence_pos += 1
+
+    assert self.app.sequence_pos >= 0
+    assert self.app.sequence_pos < len(self.app.sequence)
+
+    self.app._mode = EDIT_MODE
+    self.app.ui_delegate = None
@@ -1,13 +1,70 @@
+import time
+
 from .base import EndStep, BlockStep
-from ..const import EDIT_MODE
+from .. import leds
+from ..bake import bake_loop
+from ..program import loop_takes_time
+from ..const import EDIT_MODE, PLAY_MODE
 
 class RepeatForeverStep(BlockStep):
+  type_name = "forever"
+
+  def __init__(self):
+    super().__init__()
+    # a bake.BakedLoop, if the body of this block can be baked. This is
+    # set by analyse_body when the program is linked.
+    self._baked = None
+    # True if nothing in the body can wait, so the loop will spin
+    # without a break. Also set by analyse_body.
+    self.busy = False
+
+  def analyse_body(self, sequence):
+    self._baked = bake_loop(sequence, self._step_number, self._end_step)
+    self.busy = not loop_takes_time(sequence, self._step_number, self._end_step)
+
+  def enter_step(self):
+    if self._baked is not None:
+      # hand over to the baked loop, which will keep playing until
+      # a When-block interrupts it.
+      self._baked.start(time.ticks_ms())
+      leds.animation = self._baked
+
+  def progress_step(self):
+    # when baked, stay on this step: the baked loop does everything.
+    return self._baked is None
+
   def progress_end_step(self):
+    if self._baked is not None:
+      # we only get here after an interrupted baked loop was finished
+      # off by the interpreter: go back to playing the baked loop.
+      return self._step_number
     # continue from the step we were at before
     return self._step_number + 1
 
+  def playing_baked(self):
+    return self._baked is not None and leds.animation is self._baked
+
+  def save_state(self, now):
+    baked = self._baked
+    if baked is not None and self.playing_baked():
+      return baked.phase(now)
+    return None
+
+  def restore_state(self, state, now):
+    if self._baked is None:
+      # the loop was baked when the checkpoint was made but isn't now:
+      # the interpreter carries on from the saved position instead.
+      return
+    self._baked.start(now, state)
+    leds.animation = self._baked
+
   def render(self, mode, ctx, render_step, y, text_colour):
-    text = "Repeat forever"
+    if self.busy and mode != PLAY_MODE:
+      # warn about a loop that will hog the badge when it runs
+      text = "Repeat forever - no pause!"
+      text_colour = (255, 0, 0)
+    else:
+      text = "Repeat forever"
     tw = ctx.text_width(text)
     ctx.move_to(int(-tw/2), y).rgb(*text_colour).text(text)
 
@@ -20,10 +77,7 @@ class InsertRepeatForeverStepUI:
       self.app = app
 
   def update(self, delta):
-    self.app.sequence.insert(self.app.sequence_pos, RepeatForeverStep())
-    self.app.sequence_pos += 1
-
-    self.app.sequence.insert(self.app.sequence_pos, EndStep())
+    self.app.insert_steps(self.app.sequence_pos, [RepeatForeverStep(), EndStep()])
 
     # advance cursor onto the new end step so that subsequent inserts will insert into the new block
     self.app.sequence_pos += 1
@@ -0,0 +1,67 @@
+from .base import EndStep, BlockStep
+from .variables import VARIABLE_CHOICES
+from ..const import EDIT_MODE
+from ..expr import compile_expr, evaluate
+from ..pickers.choice import ChoicesUI
+
+
+class IfStep(BlockStep):
+  """Run the steps in the block only if the expression is not 0."""
+  type_name = "if"
+
+  def __init__(self, expr_src):
+    super().__init__()
+    self.expr_src = expr_src
+    self.code = compile_expr(expr_src)
+
+  def progress_step(self):
+    if evaluate(self.code) != 0:
+      return True
+    else:
+      # skip the whole block, using the end step found by _reset_steps
+      return self._end_step + 1
+
+  def progress_end_step(self):
+    return True
+
+  def params(self):
+    return [self.expr_src]
+
+  def render(self, mode, ctx, render_step, y, text_colour):
+    if self._text_changed(render_step):
+      self._text = f"{render_step}: If {self.expr_src}"
+    text = self._text
+    tw = ctx.text_width(text)
+    ctx.move_to(int(-tw/2), y).rgb(*text_colour).text(text)
+
+  def get_end_name(self):
+    return "if"
+
+
+class InsertIfStepUI:
+  def __init__(self, app):
+    self.app = app
+    self.ui_delegate = ChoicesUI(app, [VARIABLE_CHOICES, ["=", "!=", "<", ">"], ["0", "1", "2", "5", "10"]], self._handle_chosen)
+
+  def update(self, delta):
+    self.ui_delegate.update(delta)
+
+  def draw(self, ctx):
+    self.ui_delegate.draw(ctx)
+
+  def _handle_chosen(self, chosen):
+    self.app.insert_steps(self.app.sequence_pos, [IfStep(" ".join(chosen)), EndStep()])
+
+    # advance cursor onto the new end step so that subsequent inserts will insert into the new block
+    self.app.sequence_pos += 1
+
+    assert self.app.sequence_pos >= 0
+    assert self.app.sequence_pos < len(self.app.sequence)
+
+    # this will make the end step be populated properly
+    # which won't happen otherwise.
+    self.app._reset_steps()
+
+    # and remove ourselves from the app
+    self.app.ui_delegate = None
+    self.app._mode = EDIT_MODE
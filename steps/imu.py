@@ -1,17 +1,35 @@
 import imu
+import time
 
 from .base import EndStep, WhenStep
 from ..const import LIVE_SIZE, EDIT_MODE
 
+# How often to read the IMU. Every reading allocates (the driver returns
+# a new tuple of floats), so it isn't read on every poll: ten times a
+# second is still quick enough to notice the badge being turned upright.
+POLL_PERIOD_MS = 100
+
 
 class WhenIMUUpright(WhenStep):
+  type_name = "when_upright"
   def __init__(self):
     super().__init__()
     # when upright, IMU says (approx) (9, 0, 0)
     self.last_state = 0  # 0 = unknown
     self.last_imu_x = 0.0
+    # when the IMU is next due to be read
+    self._next_poll_ms = time.ticks_ms()
+
+  def reset(self):
+    super().reset()
+    self._next_poll_ms = time.ticks_ms()
 
   def poll_for_when(self):
+    now = time.ticks_ms()
+    if time.ticks_diff(now, self._next_poll_ms) < 0:
+      return False
+    self._next_poll_ms = time.ticks_add(now, POLL_PERIOD_MS)
+
     next_imu_acc = imu.acc_read()
     imu_x = next_imu_acc[0]
     self.last_imu_x = imu_x
@@ -35,6 +53,13 @@ class WhenIMUUpright(WhenStep):
   def progress_step(self):
     return False
 
+  def save_state(self, now):
+    return super().save_state(now) + [self.last_state]
+
+  def restore_state(self, state, now):
+    super().restore_state(state, now)
+    self.last_state = state[1]
+
   def render(self, mode, ctx, render_step, y, text_colour):
     text = f"When badge goes upright"
     tw = ctx.text_width(text)
@@ -51,8 +76,7 @@ class InsertIMUUpright:
 
   def update(self, delta):
     """This is a WhenStep so the insert should happen at the end of the program, as a new top level block."""
-    self.app.sequence.append(WhenIMUUpright())
-    self.app.sequence.append(EndStep())
+    self.app.insert_steps(len(self.app.sequence), [WhenIMUUpright(), EndStep()])
 
     # move cursor to end step so that a subsequent InsertStep will populate the new when block
     self.app.sequence_pos = len(self.app.sequence) - 1
@@ -1,30 +1,50 @@
-from tildagonos import tildagonos
-
 from .base import Step
+from .. import leds
+from .. import params
 from ..const import EDIT_MODE
-from ..pickers.colour import ColourPicker
 
 
-class LEDStep(Step):
+class LEDParams:
+  """What an LEDStep sets, shared between identical steps (see params)."""
+
   def __init__(self, r, g, b):
     self.rgb = (r, g, b)
-    self.leds = list(range(0,12)) # all LEDs
+    self.leds = leds.ALL_LEDS
+    # for drawing with
+    self.colour = (r / 256, g / 256, b / 256)
+
+
+class LEDStep(Step):
+  type_name = "led"
+
+  def __init__(self, r, g, b):
+    self.record = params.shared(LEDParams, r, g, b)
+
+  @property
+  def rgb(self):
+    return self.record.rgb
+
+  @property
+  def leds(self):
+    return self.record.leds
 
   def enter_step(self):
+    record = self.record
+    leds.set_leds(record.leds, record.rgb)
+    leds.show()
 
-    colour = self.rgb
-    for n in self.leds:
-      tildagonos.leds[n+1] = colour
-    tildagonos.leds.write()
+  def params(self):
+    return list(self.record.rgb)
 
   def render(self, mode, ctx, render_step, y, text_colour):
-    text = f"{render_step}: Set LEDs to "
+    if self._text_changed(render_step):
+      self._text = f"{render_step}: Set LEDs to "
+    text = self._text
     tw = ctx.text_width(text)
     tw2 = ctx.text_width("this colour")
     w = tw + tw2
-    this_colour = (self.rgb[0] / 256, self.rgb[1] / 256, self.rgb[2] / 256)
     ctx.move_to(int(-w/2), y).rgb(*text_colour).text(text)
-    ctx.move_to(int(-w/2 + tw), y).rgb(*this_colour).text("this colour")
+    ctx.move_to(int(-w/2 + tw), y).rgb(*self.record.colour).text("this colour")
 
 
 # TODO: the top STEP UI needs to choose both a colour and a set
@@ -41,7 +61,9 @@ class InsertLEDStepUI:
   def __init__(self, app):
     self.app = app
     self.rgb = (0,0,0)
-    self.ui_delegate = ColourPicker(app, callback=self.handle_colour_chosen)
+    # imported here so the colour picker is only loaded when needed
+    from ..pickers.colour import open_colour_picker
+    self.ui_delegate = open_colour_picker(app, self.handle_colour_chosen)
 
   def update(self, delta):
     self.ui_delegate.update(delta)
@@ -59,7 +81,7 @@ class InsertLEDStepUI:
     r = self.rgb[0]
     g = self.rgb[1]
     b = self.rgb[2]
-    self.app.sequence.insert(self.app.sequence_pos, LEDStep(r, g, b))
+    self.app.insert_steps(self.app.sequence_pos, [LEDStep(r, g, b)])
     self.app.sequence_pos += 1
 
     assert self.app.sequence_pos >= 0
@@ -1,49 +1,101 @@
 import time
 
-from app_components import Menu
-
 from .base import Step
+from .. import clock
+from .. import params
 from ..const import PLAY_MODE, EDIT_MODE
+from ..pickers.menu import open_menu
 
-class PauseStep(Step):
-  def __init__(self, ms):
+class PauseParams:
+  """How long a PauseStep pauses, shared between identical steps (see
+  params)."""
+
+  def __init__(self, ms, beats):
     self.ms = ms
+    self.beats = beats
+
+
+class PauseStep(Step):
+  """Pause for ms, or for a number of beats at the current tempo if
+  beats is not 0."""
+  type_name = "pause"
+
+  def __init__(self, ms, beats=0):
+    self.record = params.shared(PauseParams, ms, beats)
     self.reset()
 
+  @property
+  def ms(self):
+    return self.record.ms
+
+  @property
+  def beats(self):
+    return self.record.beats
+
   def enter_step(self):
-    self.entered_time = time.ticks_ms()
+    # time from when the previous pause should have ended, not from
+    # now, so that lateness doesn't accumulate.
+    record = self.record
+    self.deadline = clock.deadline_after(record.ms, record.beats)
+    clock.wake_at(self.deadline)
 
   def progress_step(self):
-    assert self.entered_time is not None, "Step should have been entered before being progressed"
+    # the step has always been entered first, which sets the deadline
     now = time.ticks_ms()
-    delta_ticks = time.ticks_diff(now, self.entered_time)
-    b = delta_ticks > self.ms
-    if b:
-      self.entered_time = None
-    return b
+    if time.ticks_diff(now, self.deadline) >= 0:
+      clock.pause_finished(self.deadline, now)
+      self.deadline = None
+      return True
+    clock.wake_at(self.deadline)
+    return False
 
   def render(self, mode, ctx, render_step, y, text_colour):
 
-    if self.entered_time is not None and mode == PLAY_MODE:
-      now = time.ticks_ms()
-      duration = self.ms - time.ticks_diff(now, self.entered_time)
+    if self.beats != 0 and (self.deadline is None or mode != PLAY_MODE):
+      if self._text_changed(render_step, -1):
+        self._text = f"{render_step}: Pause {self.beats} beats"
     else:
-      duration = self.ms
-
-    duration_s = str(int(duration / 100) / 10)
-
-    text = f"{render_step}: Pause {duration_s}s"
+      if self.deadline is not None and mode == PLAY_MODE:
+        duration = time.ticks_diff(self.deadline, time.ticks_ms())
+      else:
+        duration = self.ms
+
+      # the text only changes every tenth of a second while counting down
+      tenths = max(duration // 100, 0)
+      if self._text_changed(render_step, tenths):
+        self._text = f"{render_step}: Pause {tenths // 10}.{tenths % 10}s"
+    text = self._text
     tw = ctx.text_width(text)
     ctx.move_to(int(-tw/2), y).rgb(*text_colour).text(text)
 
   def reset(self):
-    self.entered_time = None
+    self.deadline = None
+
+  def takes_time(self):
+    return self.ms > 0 or self.beats > 0
+
+  def params(self):
+    if self.beats != 0:
+      return [self.ms, self.beats]
+    return [self.ms]
+
+  def save_state(self, now):
+    # save how long is left to run, rather than a ticks_ms value
+    if self.deadline is None:
+      return None
+    return time.ticks_diff(self.deadline, now)
+
+  def restore_state(self, state, now):
+    self.deadline = time.ticks_add(now, state)
+
+
+_DURATION_LABELS = ["500ms", "1 second", "5 seconds", "30 seconds", "1 beat", "2 beats", "4 beats"]
 
 
 class InsertPauseStepUI:
   def __init__(self, app):
     self.app = app
-    self.ui_delegate = Menu(self.app, ["500ms", "1 second", "5 seconds", "30 seconds"], back_handler=self._handle_menu_back, select_handler=self._handle_menu_select)
+    self.ui_delegate = open_menu(self.app, "pause", _DURATION_LABELS, self._handle_menu_select, self._handle_menu_back)
 
   def _handle_menu_back(self):
     # this goes back to edit mode when a more consistent flow would be to
@@ -65,6 +117,7 @@ class InsertPauseStepUI:
   def _handle_menu_select(self, item, idx):
     self.ui_delegate._cleanup()
 
+    beats = 0
     if idx == 0:
       ms = 500
     elif idx == 1:
@@ -73,10 +126,19 @@ class InsertPauseStepUI:
       ms = 5000
     elif idx == 3:
       ms = 30000
+    elif idx == 4:
+      ms = 0
+      beats = 1
+    elif idx == 5:
+      ms = 0
+      beats = 2
+    elif idx == 6:
+      ms = 0
+      beats = 4
     else:
       assert False, "invalid duration menu option"
 
-    self.app.sequence.insert(self.app.sequence_pos, PauseStep(ms))
+    self.app.insert_steps(self.app.sequence_pos, [PauseStep(ms, beats)])
     self.app.sequence_pos += 1
 
     assert self.app.sequence_pos >= 0
@@ -0,0 +1,87 @@
+from .base import EndStep, BlockStep
+from .variables import VARIABLE_CHOICES
+from ..const import EDIT_MODE
+from ..expr import compile_expr, evaluate
+from ..pickers.choice import ChoicesUI
+
+
+class RepeatTimesStep(BlockStep):
+  """Run the steps in the block a number of times. The number is an
+  expression, evaluated each time the block is started."""
+  type_name = "repeat"
+
+  def __init__(self, expr_src):
+    super().__init__()
+    self.expr_src = expr_src
+    self.code = compile_expr(expr_src)
+    self.reset()
+
+  def enter_step(self):
+    self.remaining = evaluate(self.code)
+
+  def progress_step(self):
+    if self.remaining > 0:
+      return True
+    else:
+      # skip the whole block, using the end step found by _reset_steps
+      return self._end_step + 1
+
+  def progress_end_step(self):
+    self.remaining -= 1
+    if self.remaining > 0:
+      # go round again without re-entering this step, which would
+      # restart the count.
+      return self._step_number + 1
+    else:
+      return True
+
+  def reset(self):
+    self.remaining = 0
+
+  def params(self):
+    return [self.expr_src]
+
+  def save_state(self, now):
+    return self.remaining
+
+  def restore_state(self, state, now):
+    self.remaining = state
+
+  def render(self, mode, ctx, render_step, y, text_colour):
+    if self._text_changed(render_step):
+      self._text = f"{render_step}: Repeat {self.expr_src} times"
+    text = self._text
+    tw = ctx.text_width(text)
+    ctx.move_to(int(-tw/2), y).rgb(*text_colour).text(text)
+
+  def get_end_name(self):
+    return "repeat"
+
+
+class InsertRepeatTimesStepUI:
+  def __init__(self, app):
+    self.app = app
+    self.ui_delegate = ChoicesUI(app, [["2", "3", "5", "10"] + VARIABLE_CHOICES], self._handle_chosen)
+
+  def update(self, delta):
+    self.ui_delegate.update(delta)
+
+  def draw(self, ctx):
+    self.ui_delegate.draw(ctx)
+
+  def _handle_chosen(self, chosen):
+    self.app.insert_steps(self.app.sequence_pos, [RepeatTimesStep(chosen[0]), EndStep()])
+
+    # advance cursor onto the new end step so that subsequent inserts will insert into the new block
+    self.app.sequence_pos += 1
+
+    assert self.app.sequence_pos >= 0
+    assert self.app.sequence_pos < len(self.app.sequence)
+
+    # this will make the end step be populated properly
+    # which won't happen otherwise.
+    self.app._reset_steps()
+
+    # and remove ourselves from the app
+    self.app.ui_delegate = None
+    self.app._mode = EDIT_MODE
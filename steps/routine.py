@@ -0,0 +1,139 @@
+from .base import EndStep, Step, WhenStep
+from .. import calls
+from ..const import LIVE_SIZE, EDIT_MODE
+from ..pickers.menu import open_menu
+
+# routines are numbered, and the insert menus offer this many
+NUM_ROUTINES = 4
+_ROUTINE_LABELS = [f"Routine {n}" for n in range(1, NUM_ROUTINES + 1)]
+
+
+class DefineRoutineStep(WhenStep):
+  """Top-level block of steps that Call routine steps can run. It is a
+  When block that never fires by itself, so it is linked, verified and
+  given a CPU quota like any other: the steps in a routine are charged
+  to the routine, whichever block called it."""
+  type_name = "define_routine"
+
+  def __init__(self, number):
+    super().__init__()
+    self.number = number
+    # True if anything in the routine (including routines that it
+    # calls) can wait. Set by program.resolve_calls.
+    self._takes_time = False
+
+  def get_end_name(self):
+    return "routine"
+
+  def progress_step(self):
+    return False
+
+  def progress_end_step(self):
+    # return to the step after the call
+    pos = calls.pop()
+    if pos < 0:
+      return False
+    return pos
+
+  def render(self, mode, ctx, render_step, y, text_colour):
+    if self._text_changed(render_step):
+      self._text = f"Define routine {self.number}"
+    text = self._text
+    tw = ctx.text_width(text)
+    ctx.move_to(int(-tw/2), y).rgb(*text_colour).text(text)
+    ctx.rgb(255,0,0).begin_path()
+    ctx.move_to(-240, y - LIVE_SIZE/2)
+    ctx.line_to(240, y - LIVE_SIZE/2)
+    ctx.stroke()
+
+  def params(self):
+    return [self.number]
+
+
+class CallRoutineStep(Step):
+  """Run the steps of a routine, then carry on after this step."""
+  type_name = "call_routine"
+
+  def __init__(self, number):
+    super().__init__()
+    self.number = number
+    # the DefineRoutineStep for this routine, or None if there isn't
+    # one. Set by program.resolve_calls, so that nothing is looked up
+    # while playing.
+    self._target = None
+
+  def progress_step(self):
+    # verify checks that every call has a routine before play starts, so
+    # this is only None in an unplayable program.
+    target = self._target
+    if target is None:
+      return True
+    if not calls.push(self._step_number + 1):
+      # (only reported once, rather than every time while it lasts)
+      if calls.overflows == 1:
+        print(f"Routine calls nested too deeply at step {self._step_number} - skipping calls")
+      return True
+    return target._step_number + 1
+
+  def takes_time(self):
+    return self._target is not None and self._target._takes_time
+
+  def render(self, mode, ctx, render_step, y, text_colour):
+    if self._text_changed(render_step):
+      self._text = f"{render_step}: Call routine {self.number}"
+    text = self._text
+    tw = ctx.text_width(text)
+    ctx.move_to(int(-tw/2), y).rgb(*text_colour).text(text)
+
+  def params(self):
+    return [self.number]
+
+
+class _InsertRoutineUI:
+  def __init__(self, app):
+    self.app = app
+    self.ui_delegate = open_menu(app, "routine", _ROUTINE_LABELS, self._handle_menu_select, self._handle_menu_back)
+
+  def update(self, delta):
+    self.ui_delegate.update(delta)
+
+  def draw(self, ctx):
+    self.ui_delegate.draw(ctx)
+
+  def _insert(self, number):
+    """Insert the step(s) for routine number."""
+    ...
+
+  def _handle_menu_back(self):
+    self.ui_delegate._cleanup()
+    self.app.ui_delegate = None
+    self.app._mode = EDIT_MODE
+
+  def _handle_menu_select(self, item, idx):
+    self.ui_delegate._cleanup()
+    self._insert(idx + 1)
+
+    assert self.app.sequence_pos >= 0
+    assert self.app.sequence_pos < len(self.app.sequence)
+
+    self.app.ui_delegate = None
+    self.app._mode = EDIT_MODE
+
+
+class InsertDefineRoutineUI(_InsertRoutineUI):
+  def _insert(self, number):
+    # This is a top level block, like a When, so it goes at the end of
+    # the program.
+    self.app.insert_steps(len(self.app.sequence), [DefineRoutineStep(number), EndStep()])
+
+    # move cursor to end step so that a subsequent InsertStep will populate the new block
+    self.app.sequence_pos = len(self.app.sequence) - 1
+
+    # link the new end step
+    self.app._reset_steps()
+
+
+class InsertCallRoutineUI(_InsertRoutineUI):
+  def _insert(self, number):
+    self.app.insert_steps(self.app.sequence_pos, [CallRoutineStep(number)])
+    self.app.sequence_pos += 1
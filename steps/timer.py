@@ -0,0 +1,145 @@
+from .base import EndStep, WhenStep
+from .. import timers
+from ..const import LIVE_SIZE, EDIT_MODE
+from ..pickers.menu import open_menu
+
+
+class TimerWhenStep(WhenStep):
+  """Base for When steps fired by the timer heap (see timers). First due
+  ms after play starts, and then every period_ms after that if period_ms
+  is not 0. label is what is shown in the program."""
+
+  def __init__(self, ms, period_ms, label):
+    super().__init__()
+    self.ms = ms
+    self._label = label
+    self._period_ms = period_ms
+    self._fired = False
+    # this step's entry in the timer heap
+    self._entry = timers.make_entry(self)
+
+  def reset(self):
+    super().reset()
+    self._fired = False
+    # the app clears the timer heap before resetting steps
+    self._entry[0] = self.ms
+    timers.schedule(self._entry)
+
+  def timer_fired(self, entry, elapsed):
+    self._fired = True
+    if self._period_ms > 0:
+      # keep to the original schedule, but if the timer is more than a
+      # period late, skip the missed firings rather than firing them all
+      # at once.
+      entry[0] += self._period_ms
+      if entry[0] <= elapsed:
+        entry[0] += ((elapsed - entry[0]) // self._period_ms + 1) * self._period_ms
+      timers.schedule(entry)
+
+  def poll_for_when(self):
+    if self._fired:
+      self._fired = False
+      return True
+    return False
+
+  def progress_step(self):
+    return False
+
+  def render(self, mode, ctx, render_step, y, text_colour):
+    text = self._label
+    tw = ctx.text_width(text)
+    ctx.move_to(int(-tw/2), y).rgb(*text_colour).text(text)
+    ctx.rgb(255,0,0).begin_path()
+    ctx.move_to(-240, y - LIVE_SIZE/2)
+    ctx.line_to(240, y - LIVE_SIZE/2)
+    ctx.stroke()
+
+  def params(self):
+    return [self.ms]
+
+  def save_state(self, now):
+    # when the timer is next due (relative to play starting, like the
+    # clock's saved epoch), or -1 if it has finished.
+    if timers.is_scheduled(self._entry):
+      due = self._entry[0]
+    else:
+      due = -1
+    return super().save_state(now) + [due, self._fired]
+
+  def restore_state(self, state, now):
+    super().restore_state(state, now)
+    if state[1] < 0:
+      timers.unschedule(self._entry)
+    else:
+      timers.reschedule(self._entry, state[1])
+    self._fired = state[2]
+
+
+def _seconds(ms):
+  return f"{ms // 1000}.{ms % 1000 // 100}s"
+
+
+class WhenEveryStep(TimerWhenStep):
+  type_name = "when_every"
+
+  def __init__(self, ms):
+    super().__init__(ms, ms, "Every " + _seconds(ms))
+
+
+class WhenAfterStep(TimerWhenStep):
+  type_name = "when_after"
+
+  def __init__(self, ms):
+    super().__init__(ms, 0, "After " + _seconds(ms) + " of play")
+
+
+# menu labels and the times they mean, in menu order
+_TIMES = [("100ms", 100), ("500ms", 500), ("1 second", 1000), ("5 seconds", 5000), ("30 seconds", 30000), ("1 minute", 60000)]
+_TIME_LABELS = [label for (label, _) in _TIMES]
+
+
+class _InsertTimerUI:
+  # set by subclasses to the kind of step to insert
+  step_class: type = WhenEveryStep
+
+  def __init__(self, app):
+    self.app = app
+    self.ui_delegate = open_menu(app, "timer", _TIME_LABELS, self._handle_menu_select, self._handle_menu_back)
+
+  def update(self, delta):
+    self.ui_delegate.update(delta)
+
+  def draw(self, ctx):
+    self.ui_delegate.draw(ctx)
+
+  def _handle_menu_back(self):
+    self.ui_delegate._cleanup()
+    self.app.ui_delegate = None
+    self.app._mode = EDIT_MODE
+
+  def _handle_menu_select(self, item, idx):
+    self.ui_delegate._cleanup()
+
+    # This is a WhenStep so the insert should happen at the end of the
+    # program, as a new top level block.
+    self.app.insert_steps(len(self.app.sequence), [self.step_class(_TIMES[idx][1]), EndStep()])
+
+    # move cursor to end step so that a subsequent InsertStep will populate the new when block
+    self.app.sequence_pos = len(self.app.sequence) - 1
+
+    assert self.app.sequence_pos >= 0
+    assert self.app.sequence_pos < len(self.app.sequence)
+
+    # link the new end step
+    self.app._reset_steps()
+
+    self.app.ui_delegate = None
+    self.app._mode = EDIT_MODE
+
+
+class InsertWhenEveryUI(_InsertTimerUI):
+  step_class = WhenEveryStep
+
+
+class InsertWhenAfterUI(_InsertTimerUI):
+  step_class = WhenAfterStep
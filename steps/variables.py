@@ -0,0 +1,100 @@
+from .base import Step
+from .. import variables
+from ..const import EDIT_MODE
+from ..expr import compile_expr, evaluate
+from ..pickers.choice import ChoicesUI
+
+
+class SetVariableStep(Step):
+  type_name = "set_var"
+
+  def __init__(self, var, expr_src):
+    self.var = var
+    self.expr_src = expr_src
+    self.code = compile_expr(expr_src)
+
+  def enter_step(self):
+    variables.registers[self.var] = evaluate(self.code)
+
+  def params(self):
+    return [self.var, self.expr_src]
+
+  def render(self, mode, ctx, render_step, y, text_colour):
+    if self._text_changed(render_step):
+      self._text = f"{render_step}: Set {variables.VARIABLE_NAMES[self.var]} to {self.expr_src}"
+    text = self._text
+    tw = ctx.text_width(text)
+    ctx.move_to(int(-tw/2), y).rgb(*text_colour).text(text)
+
+
+class ChangeVariableStep(Step):
+  type_name = "add_var"
+
+  def __init__(self, var, expr_src):
+    self.var = var
+    self.expr_src = expr_src
+    self.code = compile_expr(expr_src)
+
+  def enter_step(self):
+    variables.registers[self.var] += evaluate(self.code)
+
+  def params(self):
+    return [self.var, self.expr_src]
+
+  def render(self, mode, ctx, render_step, y, text_colour):
+    if self._text_changed(render_step):
+      self._text = f"{render_step}: Change {variables.VARIABLE_NAMES[self.var]} by {self.expr_src}"
+    text = self._text
+    tw = ctx.text_width(text)
+    ctx.move_to(int(-tw/2), y).rgb(*text_colour).text(text)
+
+
+VARIABLE_CHOICES = [c for c in variables.VARIABLE_NAMES]
+
+
+class InsertSetVariableUI:
+  def __init__(self, app):
+    self.app = app
+    self.ui_delegate = ChoicesUI(app, [VARIABLE_CHOICES, ["0", "1", "2", "5", "10", "100"]], self._handle_chosen)
+
+  def update(self, delta):
+    self.ui_delegate.update(delta)
+
+  def draw(self, ctx):
+    self.ui_delegate.draw(ctx)
+
+  def _handle_chosen(self, chosen):
+    step = SetVariableStep(variables.variable_number(chosen[0]), chosen[1])
+    self.app.insert_steps(self.app.sequence_pos, [step])
+    self.app.sequence_pos += 1
+
+    assert self.app.sequence_pos >= 0
+    assert self.app.sequence_pos < len(self.app.sequence)
+
+    # and remove ourselves from the app
+    self.app.ui_delegate = None
+    self.app._mode = EDIT_MODE
+
+
+class InsertChangeVariableUI:
+  def __init__(self, app):
+    self.app = app
+    self.ui_delegate = ChoicesUI(app, [VARIABLE_CHOICES, ["1", "-1", "10", "-10"]], self._handle_chosen)
+
+  def update(self, delta):
+    self.ui_delegate.update(delta)
+
+  def draw(self, ctx):
+    self.ui_delegate.draw(ctx)
+
+  def _handle_chosen(self, chosen):
+    step = ChangeVariableStep(variables.variable_number(chosen[0]), chosen[1])
+    self.app.insert_steps(self.app.sequence_pos, [step])
+    self.app.sequence_pos += 1
+
+    assert self.app.sequence_pos >= 0
+    assert self.app.sequence_pos < len(self.app.sequence)
+
+    # and remove ourselves from the app
+    self.app.ui_delegate = None
+    self.app._mode = EDIT_MODE
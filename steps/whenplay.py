@@ -2,6 +2,7 @@ from .base import EndStep, WhenStep
 from ..const import LIVE_SIZE, EDIT_MODE
 
 class WhenPlayStep(WhenStep):
+  type_name = "when_play"
 
   def __init__(self):
     super().__init__()
@@ -27,8 +28,16 @@ class WhenPlayStep(WhenStep):
     ctx.stroke()
 
   def reset(self):
+    super().reset()
     self._start = True
 
+  def save_state(self, now):
+    return super().save_state(now) + [self._start]
+
+  def restore_state(self, state, now):
+    super().restore_state(state, now)
+    self._start = state[1]
+
 
 class InsertWhenPlayStepUI:
   def __init__(self, app):
@@ -36,8 +45,7 @@ class InsertWhenPlayStepUI:
 
   def update(self, delta):
     """This is a WhenStep so the insert should happen at the end of the program, as a new top level block."""
-    self.app.sequence.append(WhenPlayStep())
-    self.app.sequence.append(EndStep())
+    self.app.insert_steps(len(self.app.sequence), [WhenPlayStep(), EndStep()])
 
     # move cursor to end step so that a subsequent InsertStep will populate the new when block
     self.app.sequence_pos = len(self.app.sequence) - 1
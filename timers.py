@@ -0,0 +1,70 @@
+# Timer triggers.
+#
+# Timer When-steps (steps.timer) put an entry in one shared min-heap of
+# deadlines, kept as ms after play started so that the heap can be built
+# before play starts, and doesn't need changing if play is checkpointed
+# and resumed. Each update, poll only has to look at the top of the heap
+# to know that nothing is due, however many timers there are, and firing
+# a timer is a pop and (for repeating timers) a push.
+#
+# Heap entries are lists of [due, serial number, step], made by
+# make_entry, owned by their step and reused, so that rescheduling
+# doesn't allocate. The serial number breaks ties, so that steps
+# themselves are never compared.
+
+import heapq
+import time
+
+from . import clock
+
+_heap: list = []
+_serial = 0
+
+
+def make_entry(step):
+  global _serial
+  _serial += 1
+  return [0, _serial, step]
+
+
+def clear():
+  """Forget all timers, for example because the program is being reset."""
+  _heap.clear()
+
+
+def schedule(entry):
+  """Add a timer, due entry[0] ms after play started."""
+  heapq.heappush(_heap, entry)
+
+
+def is_scheduled(entry):
+  return entry in _heap
+
+
+def unschedule(entry):
+  if entry in _heap:
+    _heap.remove(entry)
+    heapq.heapify(_heap)
+
+
+def reschedule(entry, due):
+  """Change when a timer that may already be scheduled is due."""
+  unschedule(entry)
+  entry[0] = due
+  schedule(entry)
+
+
+def poll(now):
+  """Fire every timer that is due by now, by calling its step's
+  timer_fired(entry, elapsed). A step that wants to go again should
+  update entry[0] and schedule it again."""
+  if len(_heap) == 0:
+    return
+  elapsed = time.ticks_diff(now, clock.play_epoch_ms)
+  while len(_heap) > 0 and _heap[0][0] <= elapsed:
+    entry = heapq.heappop(_heap)
+    entry[2].timer_fired(entry, elapsed)
+  if len(_heap) > 0:
+    # make sure the app steps when the next timer is due, rather than
+    # on its next regular step.
+    clock.wake_at(time.ticks_add(clock.play_epoch_ms, _heap[0][0]))
@@ -0,0 +1,242 @@
+"""Check a directory of saved Scripter programs on the host.
+
+For each program (*.json) this checks that it loads and is well formed,
+using the same rules as the app does, reports its step count and
+estimated memory use (and how much of it sharing identical step
+parameters saves), and then plays it for a simulated duration to
+collect timing statistics. Programs are processed in parallel.
+
+With --traces, what each program did to the LEDs is compared with a
+trace (see trace.py) saved by an earlier run, to check that a change to
+the app hasn't changed what programs do. Programs that don't have a
+saved trace yet get one.
+
+This runs on CPython, against the simulator's stand-in hardware and
+firmware modules, which need to be importable: see check-programs.sh.
+
+A program file holds either a program (a list of steps, as saved by
+program.program_to_data), or an object with a "program" key, such as a
+checkpoint or a program library file.
+"""
+
+import argparse
+import concurrent.futures
+import contextlib
+import glob
+import importlib.util
+import io
+import json
+import os
+import sys
+import time
+from typing import Any
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# The repo is imported as a package under this name, whatever its
+# directory happens to be called.
+PACKAGE_NAME = "scripter"
+
+# Simulated ms between app updates. The badge calls update roughly
+# this often.
+UPDATE_MS = 20
+
+
+class SimClock:
+  """Simulated MicroPython ticks, installed into the time module so that
+  programs can be run faster than real time."""
+
+  def __init__(self):
+    self.now = 0
+
+  def install(self):
+    time.ticks_ms = lambda: self.now  # type: ignore
+    time.ticks_us = lambda: self.now * 1000  # type: ignore
+    time.ticks_add = lambda a, b: a + b  # type: ignore
+    time.ticks_diff = lambda a, b: a - b  # type: ignore
+
+
+_clock = SimClock()
+
+
+def _import_package():
+  if PACKAGE_NAME in sys.modules:
+    return sys.modules[PACKAGE_NAME]
+  _clock.install()
+  spec = importlib.util.spec_from_file_location(PACKAGE_NAME, os.path.join(REPO_DIR, "__init__.py"),
+                                                submodule_search_locations=[REPO_DIR])
+  assert spec is not None and spec.loader is not None
+  pkg = importlib.util.module_from_spec(spec)
+  sys.modules[PACKAGE_NAME] = pkg
+  spec.loader.exec_module(pkg)
+  return pkg
+
+
+def _load_program_data(path):
+  with open(path) as f:
+    data = json.load(f)
+  if isinstance(data, dict):
+    data = data["program"]
+  return data
+
+
+def check_program(path, duration_ms, fast=False, traces_dir=None):
+  """Check and simulate one program. Returns a dict of results."""
+  result = {"path": path, "name": os.path.basename(path), "errors": []}
+
+  _import_package()
+  app_module = importlib.import_module(PACKAGE_NAME + ".app")
+  program = importlib.import_module(PACKAGE_NAME + ".program")
+  leds: Any = importlib.import_module(PACKAGE_NAME + ".leds")
+  trace = importlib.import_module(PACKAGE_NAME + ".trace")
+  collector = importlib.import_module(PACKAGE_NAME + ".collector")
+  verify = importlib.import_module(PACKAGE_NAME + ".verify")
+
+  # (Any, because the type checker can't follow a dynamic import)
+  ScripterApp: Any = app_module.ScripterApp
+
+  class HeadlessScripterApp(ScripterApp):
+    checkpoints_enabled = False
+
+  # the app is chatty on stdout: keep that out of the report
+  with contextlib.redirect_stdout(io.StringIO()):
+    try:
+      data = _load_program_data(path)
+    except (OSError, ValueError, KeyError) as e:
+      result["errors"].append(f"unreadable: {e}")
+      return result
+
+    # the same checks as loading from the library on the badge
+    problems = verify.check_data(data)
+    if len(problems) > 0:
+      for p in problems:
+        result["errors"].append(f"could not load steps: {p}")
+      return result
+
+    app = HeadlessScripterApp()
+    app.sequence = program.program_from_data(app, data)
+
+    result["steps"] = len(app.sequence)
+
+    problems = verify.check_structure(app.sequence)
+    if len(problems) == 0:
+      app._reset_steps()
+      problems = verify.verify(app.sequence)
+    if len(problems) > 0:
+      for p in problems:
+        result["errors"].append(f"badly formed: {p}")
+      return result
+
+    result["memory_bytes"] = program.estimate_memory(app.sequence)
+    result["shared_bytes"] = program.estimate_memory(app.sequence, shared=False) - result["memory_bytes"]
+    result["busy_loops"] = [s._step_number for s in app.sequence if s.type_name == "forever" and s.busy]
+
+    trace_stream = io.BytesIO()
+    recorder = trace.TraceRecorder(_clock.now, stream=trace_stream)
+    leds.recorder = recorder
+    app._start_play(fast=fast)
+    steps_entered = 0
+    tick_us: list[float] = []
+    end = _clock.now + duration_ms
+    try:
+      while _clock.now < end:
+        _clock.now += UPDATE_MS
+        before_pos = app.sequence_pos
+        t0 = time.perf_counter()
+        app.update(UPDATE_MS)
+        tick_us.append((time.perf_counter() - t0) * 1e6)
+        if app.sequence_pos != before_pos:
+          steps_entered += 1
+    except Exception as e:
+      result["errors"].append(f"failed while playing at {duration_ms - (end - _clock.now)}ms: {e!r}")
+    finally:
+      leds.recorder = None
+      recorder.finish(_clock.now)
+      # play turns automatic garbage collection off
+      collector.stop_play()
+
+  result["simulated_ms"] = duration_ms
+  result["steps_entered"] = steps_entered
+  result["led_frames"] = recorder.frames_recorded
+  result["times_throttled"] = sum([w.times_throttled for w in app._when_steps])
+  if traces_dir is not None:
+    _compare_trace(result, trace, trace_stream.getvalue(), traces_dir)
+  if tick_us:
+    result["update_us_mean"] = sum(tick_us) / len(tick_us)
+    result["update_us_max"] = max(tick_us)
+  return result
+
+
+def _compare_trace(result, trace, data, traces_dir):
+  # Compare a program's trace with the one saved for it, or save it if
+  # there isn't one.
+  path = os.path.join(traces_dir, os.path.splitext(result["name"])[0] + ".trace")
+  try:
+    with open(path, "rb") as f:
+      saved = f.read()
+  except FileNotFoundError:
+    with open(path, "wb") as f:
+      f.write(data)
+    result["trace"] = "saved"
+    return
+  ms = trace.first_difference(saved, data)
+  if ms is None:
+    result["trace"] = "same"
+  else:
+    result["errors"].append(f"LED output differs from {path} from {ms}ms")
+
+
+def _format(result):
+  if result["errors"]:
+    return f"FAIL {result['name']}: " + "; ".join(result["errors"])
+  text = (f"ok   {result['name']}: {result['steps']} steps, ~{result['memory_bytes']} bytes "
+          f"(~{result['shared_bytes']} saved by sharing), "
+          f"{result['steps_entered']} step changes and {result['led_frames']} LED frames "
+          f"in {result['simulated_ms'] / 1000}s, "
+          f"update {result['update_us_mean']:.0f}us mean / {result['update_us_max']:.0f}us max")
+  if result["busy_loops"]:
+    text += f", loops without a pause at steps {result['busy_loops']}"
+  if result["times_throttled"]:
+    text += f", throttled {result['times_throttled']} times"
+  if "trace" in result:
+    text += f", LED trace {result['trace']}"
+  return text
+
+
+def main(argv=None):
+  parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+  parser.add_argument("directory", help="directory of *.json program files")
+  parser.add_argument("--duration", type=float, default=60, help="simulated seconds to play each program for")
+  parser.add_argument("--fast", action="store_true", help="play as with Play fast")
+  parser.add_argument("--jobs", type=int, default=None, help="worker processes (default: one per CPU)")
+  parser.add_argument("--json", action="store_true", help="print results as JSON")
+  parser.add_argument("--traces", metavar="DIR", default=None,
+                      help="compare LED output with traces saved in DIR, saving any that are missing")
+  args = parser.parse_args(argv)
+
+  # a program library directory also has an index, which isn't a program
+  paths = sorted([p for p in glob.glob(os.path.join(args.directory, "*.json"))
+                  if os.path.basename(p) != "index.json"])
+  duration_ms = int(args.duration * 1000)
+  if args.traces is not None:
+    os.makedirs(args.traces, exist_ok=True)
+
+  start = time.perf_counter()
+  with concurrent.futures.ProcessPoolExecutor(max_workers=args.jobs) as pool:
+    results = list(pool.map(check_program, paths, [duration_ms] * len(paths), [args.fast] * len(paths),
+                            [args.traces] * len(paths)))
+  elapsed = time.perf_counter() - start
+
+  if args.json:
+    print(json.dumps(results, indent=1))
+  else:
+    for r in results:
+      print(_format(r))
+    failed = len([r for r in results if r["errors"]])
+    print(f"{len(results)} programs, {failed} failed, in {elapsed:.1f}s")
+
+  return 1 if any(r["errors"] for r in results) else 0
+
+
+if __name__ == "__main__":
+  sys.exit(main())
@@ -0,0 +1,221 @@
+# Recording and replaying LED output.
+#
+# A trace is a sequence of records, one for each time the LED frame is
+# written out, delta encoded against the previous frame:
+#
+#   2 bytes  ms since the previous record (little endian)
+#   2 bytes  mask of which LEDs changed (bit n for LED n)
+#   3 bytes  r, g, b for each changed LED, lowest LED first
+#
+# A record with an empty mask changes nothing: these are used to mark
+# the end of a trace (so that its total length is known) and to span
+# gaps longer than 65535ms.
+#
+# Replaying a trace only needs to apply the recorded changes at the
+# right times, which is much cheaper than running the program that
+# made them. Traces can also be compared, to check in the simulator
+# that a change hasn't altered what a program does: see the --traces
+# option of tools/check_programs.py.
+
+import time
+
+from . import leds
+from .const import SAVE_DIR
+
+TRACE_FILE = SAVE_DIR + "/trace.bin"
+TRACE_BUFFER_SIZE = 4096
+
+_MAX_DT = 65535
+_MAX_RECORD = 4 + leds.NUM_LEDS * 3
+
+
+class TraceRecorder:
+  def __init__(self, now, stream=None, size=TRACE_BUFFER_SIZE):
+    """Record into a preallocated buffer. If stream is given, the buffer
+    is flushed to it when full, otherwise recording stops when the
+    buffer is full and overflowed is set."""
+    self.buf = bytearray(size)
+    self.length = 0
+    self.overflowed = False
+    self.frames_recorded = 0
+    self._stream = stream
+    # start from all LEDs off, which is what replay starts from too.
+    self._prev = bytearray(leds.NUM_LEDS * 3)
+    self._last_ms = now
+
+  def _put(self, dt, mask):
+    b = self.buf
+    n = self.length
+    b[n] = dt & 0xff
+    b[n+1] = dt >> 8
+    b[n+2] = mask & 0xff
+    b[n+3] = mask >> 8
+    self.length = n + 4
+
+  def _make_room(self):
+    if self.length + _MAX_RECORD <= len(self.buf):
+      return True
+    if self._stream is not None:
+      self.flush()
+      return True
+    self.overflowed = True
+    return False
+
+  def _advance_time(self, now):
+    dt = time.ticks_diff(now, self._last_ms)
+    self._last_ms = now
+    while dt > _MAX_DT:
+      if not self._make_room():
+        return -1
+      self._put(_MAX_DT, 0)
+      dt -= _MAX_DT
+    return dt
+
+  def record(self, frame, now):
+    if self.overflowed or not self._make_room():
+      return
+    prev = self._prev
+    mask = 0
+    for n in range(0, leds.NUM_LEDS):
+      i = n * 3
+      if frame[i] != prev[i] or frame[i+1] != prev[i+1] or frame[i+2] != prev[i+2]:
+        mask |= 1 << n
+    if mask == 0:
+      # a rewrite of the same frame: nothing to record
+      return
+    dt = self._advance_time(now)
+    if dt < 0 or not self._make_room():
+      return
+    self._put(dt, mask)
+    self.frames_recorded += 1
+    b = self.buf
+    p = self.length
+    for n in range(0, leds.NUM_LEDS):
+      if mask & (1 << n):
+        i = n * 3
+        b[p] = prev[i] = frame[i]
+        b[p+1] = prev[i+1] = frame[i+1]
+        b[p+2] = prev[i+2] = frame[i+2]
+        p += 3
+    self.length = p
+
+  def finish(self, now):
+    """Mark the end of the trace, so that replay knows how long it is,
+    and flush it to the stream if there is one."""
+    dt = self._advance_time(now)
+    if dt >= 0 and self._make_room():
+      self._put(dt, 0)
+    if self._stream is not None:
+      self.flush()
+
+  def flush(self):
+    self._stream.write(memoryview(self.buf)[0:self.length])
+    self.length = 0
+
+  def data(self):
+    return bytes(self.buf[0:self.length])
+
+
+class TracePlayer:
+  """Drive the LEDs from a recorded trace, without the interpreter."""
+
+  def __init__(self, data, now, loop=True):
+    self.data = data
+    self.loop = loop
+    self.restart(now)
+
+  def restart(self, now):
+    self._pos = 0
+    # time the next record is due, relative to the start
+    self._next_ms = self._record_dt(0)
+    self._start_ms = now
+    self.finished = False
+    leds.set_leds(range(0, leds.NUM_LEDS), (0, 0, 0))
+    # so that the cleared frame is shown on the next update
+    self._changed = True
+
+  def _record_dt(self, pos):
+    if pos + 4 > len(self.data):
+      return -1
+    return self.data[pos] | (self.data[pos+1] << 8)
+
+  def update(self, now):
+    if self.finished:
+      return
+    d = self.data
+    frame = leds.frame
+    elapsed = time.ticks_diff(now, self._start_ms)
+    changed = self._changed
+    self._changed = False
+    while self._next_ms >= 0 and self._next_ms <= elapsed:
+      p = self._pos
+      mask = d[p+2] | (d[p+3] << 8)
+      p += 4
+      for n in range(0, leds.NUM_LEDS):
+        if mask & (1 << n):
+          i = n * 3
+          frame[i] = d[p]
+          frame[i+1] = d[p+1]
+          frame[i+2] = d[p+2]
+          p += 3
+      changed = changed or mask != 0
+      self._pos = p
+      dt = self._record_dt(p)
+      if dt < 0:
+        if self.loop and self._next_ms > 0:
+          # start again from where the trace ended, rather than
+          # from now, so that looping doesn't drift.
+          self.restart(time.ticks_add(self._start_ms, self._next_ms))
+          elapsed = time.ticks_diff(now, self._start_ms)
+          changed = True
+          self._changed = False
+        else:
+          self._next_ms = -1
+          self.finished = True
+      else:
+        self._next_ms += dt
+    if changed:
+      leds.show()
+
+
+def frames(data):
+  """Decode a trace into a list of (ms from start, frame bytes)."""
+  result = []
+  frame = bytearray(leds.NUM_LEDS * 3)
+  t = 0
+  p = 0
+  while p + 4 <= len(data):
+    t += data[p] | (data[p+1] << 8)
+    mask = data[p+2] | (data[p+3] << 8)
+    p += 4
+    for n in range(0, leds.NUM_LEDS):
+      if mask & (1 << n):
+        frame[n*3:n*3+3] = data[p:p+3]
+        p += 3
+    result.append((t, bytes(frame)))
+  return result
+
+
+def first_difference(a, b):
+  """Compare two traces by what the LEDs show over time. Returns the
+  time in ms of the first difference, or None if they are the same."""
+  fa = frames(a)
+  fb = frames(b)
+  for n in range(0, min(len(fa), len(fb))):
+    if fa[n] != fb[n]:
+      return min(fa[n][0], fb[n][0])
+  if len(fa) != len(fb):
+    if len(fa) < len(fb):
+      return fb[len(fa)][0]
+    else:
+      return fa[len(fb)][0]
+  return None
+
+
+def load_trace(path=TRACE_FILE):
+  """Return the saved trace, or None if there isn't one."""
+  try:
+    with open(path, "rb") as f:
+      return f.read()
+  except OSError:
+    return None
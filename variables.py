@@ -0,0 +1,20 @@
+# Program variables: a fixed size register file of integers, shared by
+# all steps. Variables are named by single letters, and steps refer to
+# them by register number so that nothing needs looking up by name
+# while playing.
+
+NUM_VARIABLES = 8
+VARIABLE_NAMES = "ABCDEFGH"
+
+registers = [0] * NUM_VARIABLES
+
+
+def reset():
+  for n in range(0, NUM_VARIABLES):
+    registers[n] = 0
+
+
+def variable_number(name):
+  """Return the register number for a variable name, or -1 if name
+  is not a variable."""
+  return VARIABLE_NAMES.find(name)
@@ -0,0 +1,184 @@
+# Checking programs before they are played.
+#
+# The interpreter relies on the program being well formed: blocks nested
+# and closed properly, When-steps only at the top level, blocks linked to
+# their end steps, every jump a step can make landing on a step, and
+# every routine call going to a routine that can't end up calling
+# itself. None of that can change while playing, so it is checked once,
+# when play starts, rather than by asserts on every step. Problems come
+# back as a list, so that they can be shown to the user rather than
+# crashing the app.
+
+from . import variables
+from .registry import param_kinds_for, step_class_for
+from .steps.base import BlockStep, EndStep, WhenStep
+
+
+class Problem:
+  """Something wrong with a program: what, and the number of the step
+  it is about (or None if it is about the whole program)."""
+
+  def __init__(self, step_number, message):
+    self.step_number = step_number
+    self.message = message
+
+  def __str__(self):
+    if self.step_number is None:
+      return self.message
+    return f"Step {self.step_number}: {self.message}"
+
+
+def check_structure(sequence):
+  """Check that blocks are nested and closed properly, so that the
+  program can be linked (see program.link_steps). Returns a list of
+  Problems, empty if there are none."""
+  return _check_nesting([type(step) for step in sequence])
+
+
+def check_data(data):
+  """Check that saved program data can be built (see
+  program.program_from_data) and linked, without building it, so that
+  the program it is to replace can be kept if it can't. Returns a list
+  of Problems, empty if there are none."""
+  problems = []
+  if not isinstance(data, list):
+    problems.append(Problem(None, "Not a program"))
+    return problems
+  classes = []
+  for (n, d) in enumerate(data):
+    if not isinstance(d, list) or len(d) == 0 or not isinstance(d[0], str):
+      problems.append(Problem(n, "Not a step"))
+      continue
+    try:
+      kinds = param_kinds_for(d[0])
+    except KeyError:
+      problems.append(Problem(n, f"Unknown step type {d[0]}"))
+      continue
+    message = _check_params(kinds, d[1:])
+    if message is not None:
+      problems.append(Problem(n, message))
+      continue
+    classes.append(step_class_for(d[0]))
+  if len(problems) > 0:
+    return problems
+  return _check_nesting(classes)
+
+
+def _check_params(kinds, params):
+  # Return what is wrong with params for a step with param_kinds kinds
+  # (see registry.StepType), or None if nothing is.
+  required = kinds.split("/")[0]
+  kinds = kinds.replace("/", "")
+  if len(params) < len(required) or len(params) > len(kinds):
+    return f"Wrong number of parameters: {len(params)}"
+  for (kind, value) in zip(kinds, params):
+    if kind == "e":
+      if not isinstance(value, str):
+        return f"Expression should be text: {value}"
+      # imported here so that expressions are only loaded when needed
+      from .expr import compile_expr
+      try:
+        compile_expr(value)
+      except ValueError as e:
+        return str(e)
+    elif not isinstance(value, int):
+      return f"Parameter should be a number: {value}"
+    elif kind == "v" and not 0 <= value < variables.NUM_VARIABLES:
+      return f"No such variable: {value}"
+  return None
+
+
+def _check_nesting(classes):
+  # check_structure, given the class of each step
+  problems = []
+  if len(classes) == 0:
+    problems.append(Problem(None, "The program is empty"))
+    return problems
+  open_blocks: list[int] = []
+  for (n, step_class) in enumerate(classes):
+    if issubclass(step_class, WhenStep):
+      if len(open_blocks) > 0:
+        problems.append(Problem(n, "When and Define routine steps can only be at the top level"))
+      open_blocks.append(n)
+    elif issubclass(step_class, EndStep):
+      if len(open_blocks) == 0:
+        problems.append(Problem(n, "End without a block to end"))
+      else:
+        open_blocks.pop()
+    else:
+      if len(open_blocks) == 0:
+        problems.append(Problem(n, "Steps must be inside a When or Define routine block"))
+      if issubclass(step_class, BlockStep):
+        open_blocks.append(n)
+  for n in open_blocks:
+    problems.append(Problem(n, "Block has no End"))
+  return problems
+
+
+def verify(sequence):
+  """Check everything that the interpreter relies on, for a linked
+  program. Returns a list of Problems, empty if it can be played."""
+  problems = check_structure(sequence)
+  if len(problems) > 0:
+    return problems
+
+  length = len(sequence)
+  when = None
+  for (n, step) in enumerate(sequence):
+    if getattr(step, "_step_number", None) != n:
+      problems.append(Problem(n, "Step is not linked into the program"))
+      continue
+    if isinstance(step, WhenStep):
+      when = step
+    if step._when is not when:
+      problems.append(Problem(n, "Step is linked to the wrong When block"))
+
+    if isinstance(step, BlockStep):
+      end = step._end_step
+      if not (n < end < length and isinstance(sequence[end], EndStep) and sequence[end]._start_step is step):
+        problems.append(Problem(n, "Block is not linked to its End"))
+      elif not isinstance(step, WhenStep) and end + 1 >= length:
+        # blocks inside a When can jump to the step after their end
+        problems.append(Problem(n, "Block can jump past the end of the program"))
+    elif isinstance(step, EndStep):
+      if not isinstance(step._start_step, BlockStep):
+        problems.append(Problem(n, "End is not linked to its block"))
+
+  if len(problems) == 0:
+    _check_routines(sequence, problems)
+  return problems
+
+
+def _check_routines(sequence, problems):
+  # Calls go to the first definition of their routine (see
+  # program.resolve_calls), so check that there is exactly one, and that
+  # routines don't call themselves, directly or through other routines,
+  # which would fill up the call stack.
+  routines: dict = {}
+  called: dict = {}
+  for step in sequence:
+    if step.type_name == "define_routine":
+      if step.number in routines:
+        problems.append(Problem(step._step_number, f"Routine {step.number} is already defined"))
+      else:
+        routines[step.number] = step
+        called[step.number] = []
+  for step in sequence:
+    if step.type_name == "call_routine":
+      if step._target is None or step._target is not routines.get(step.number):
+        problems.append(Problem(step._step_number, f"Routine {step.number} is not defined"))
+      elif step._when.type_name == "define_routine":
+        called[step._when.number].append(step.number)
+
+  for (number, routine) in routines.items():
+    # every routine reachable by calls from this one
+    seen: set = set()
+    todo = list(called[number])
+    while len(todo) > 0:
+      callee = todo.pop()
+      if callee == number:
+        problems.append(Problem(routine._step_number, f"Routine {number} calls itself"))
+        break
+      if callee not in seen:
+        seen.add(callee)
+        todo.extend(called[callee])